@@ -0,0 +1,303 @@
+"""
+Benchmark suite for fillers and getters, against a local PostGIS database.
+
+Each filler stage (prepare, apply and every fill_* method) and each getter is timed, with the number of rows it produced,
+rows per second, bytes of source files read and peak Python memory (tracemalloc, above the level at the start of the stage).
+Results are written as JSON reports, identified by commit and package version, that can be compared across commits:
+
+    python -m gis_fillers.benchmarks run --database gis_fillers_benchmark --output before.json
+    python -m gis_fillers.benchmarks run --database gis_fillers_benchmark --output after.json
+    python -m gis_fillers.benchmarks compare before.json after.json
+
+Fillers run in a dedicated schema (cleaned at the start of the run), with input files read from data_folder:
+no download happens if the files are already there. With --synthetic-zones (and --synthetic-vertices), synthetic input files
+at this scale are generated in data_folder first (see gis_fillers.synthetic).
+"""
+
+import os
+import sys
+import json
+import platform
+import argparse
+import datetime
+import subprocess
+import numpy as np
+
+from . import Database, synthetic
+from ._version import __version__
+from .fillers import zones, instrumentation
+from .getters import (
+    zone_getters,
+    generic_getters,
+    tile_getters,
+    sampling,
+    spatial_index,
+)
+
+# tables whose row count changes are reported as rows produced by filler stages
+BENCHMARK_TABLES = instrumentation.COUNTED_TABLES
+count_rows = instrumentation.count_rows
+
+
+def default_fillers():
+    """
+    Fillers of MetaFiller, plus hexagons. Population is loaded by PopulationZSFiller only, so that it is timed as a stage of its own.
+    """
+    return [
+        zones.zaehlsprengel.ZaehlsprengelFiller(include_population=False),
+        zones.zaehlsprengel.SimplifiedZSFiller(include_population=False),
+        # forced: its prepare would otherwise skip it, zaehlsprengel geometries being there already
+        zones.zaehlsprengel.PopulationZSFiller(force=True),
+        zones.zaehlsprengel.PLZFiller(),
+        zones.geonames.GeonamesFiller(),
+        zones.countries.CountriesFiller(),
+        zones.hexagons.HexagonsFiller(
+            res=7, target_zone=918, target_zone_level="bezirk"
+        ),
+    ]
+
+
+def default_getters(nb_points=10**4, seed=0):
+    """
+    Returns a list of (name, function running a getter on the database and returning its result)
+    """
+    rng = np.random.default_rng(seed)
+    long = rng.uniform(9.5, 17.2, nb_points)
+    lat = rng.uniform(46.4, 49.0, nb_points)
+    codes = ["101", "918", "902"]
+    return [
+        (
+            "PopulationGetter.bezirk",
+            lambda db: zone_getters.PopulationGetter(
+                db=db, zone_level="bezirk", simplified=False
+            ).get_result(),
+        ),
+        (
+            "PopulationDensityGetter.zaehlsprengel",
+            lambda db: zone_getters.PopulationDensityGetter(
+                db=db, zone_level="zaehlsprengel", simplified=False
+            ).get_result(),
+        ),
+        (
+            "ZoneLevelGetter.gemeinde",
+            lambda db: zone_getters.ZoneLevelGetter(
+                db=db, zone_level="gemeinde", parent_levels=("bezirk",)
+            ).get_result(),
+        ),
+        (
+            "AreaPointsGetter.bezirk",
+            lambda db: generic_getters.AreaPointsGetter(
+                db=db,
+                zone_level="bezirk",
+                location_list=[codes[i % 3] for i in range(nb_points)],
+                seed=seed,
+            ).get_result(),
+        ),
+        (
+            "ZipPointsGetter",
+            lambda db: generic_getters.ZipPointsGetter(
+                db=db,
+                location_list=[("AT", "1080"), ("AT", "1010"), ("FR", "33400")]
+                * (nb_points // 3),
+            ).get_result(),
+        ),
+        (
+            "PointsToZonesGetter",
+            lambda db: zone_getters.PointsToZonesGetter(
+                db=db, long=long, lat=lat
+            ).get_result(),
+        ),
+        (
+            "SamplingIndexGetter.bezirk",
+            lambda db: sampling.SamplingIndexGetter(
+                db=db, zone_level="bezirk"
+            ).get_result(),
+        ),
+        (
+            "MVTGetter.bezirk",
+            lambda db: tile_getters.MVTGetter(
+                db=db, z=8, x=139, y=88, gis_type="zaehlsprengel"
+            ).get_result(),
+        ),
+        (
+            "ZoneIndex.bezirk",
+            lambda db: spatial_index.ZoneIndex.from_db(db=db, zone_level="bezirk"),
+        ),
+    ]
+
+
+class BenchmarkRecorder(instrumentation.StepRecorder):
+    """
+    Records measurements of named stages in results (list of dicts: name, kind, seconds, rows, rows_per_sec, bytes_read, peak_memory).
+    Stages can be nested (e.g. apply and the fill_* methods it calls), each one reporting its own peak memory and rows produced
+    (the time spent counting rows being excluded from the seconds of enclosing stages).
+    """
+
+    def __init__(self, db, count_nested=True, **kwargs):
+        instrumentation.StepRecorder.__init__(
+            self, db=db, count_nested=count_nested, **kwargs
+        )
+
+    def run_fillers(self, fillers):
+        for filler in fillers:
+            self.db.add_filler(self.instrument_filler(filler))
+        self.db.fill_db()
+
+    def run_getters(self, getters, repeat=1):
+        for name, run_getter in getters:
+            for _ in range(repeat):
+                with self.measure(name=name, kind="getter") as record:
+                    result = run_getter(self.db)
+                    if isinstance(result, sampling.SamplingIndex):
+                        record["rows"] = len(result.triangles)
+                    elif not isinstance(result, bytes):
+                        record["rows"] = len(result)
+
+
+def git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def build_report(db, results, **extra_info):
+    db.cursor.execute("SELECT PostGIS_Lib_Version();")
+    postgis_version = db.cursor.fetchone()[0]
+    return dict(
+        created_at=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        commit=git_commit(),
+        version=__version__,
+        python=platform.python_version(),
+        postgis=postgis_version,
+        **extra_info,
+        results=results,
+    )
+
+
+def run_benchmarks(
+    conninfo,
+    schema="gis_fillers_benchmark",
+    fillers=None,
+    getters=None,
+    repeat=1,
+    clean=True,
+    **extra_info,
+):
+    """
+    Runs fillers (by default default_fillers()) in schema then getters (by default default_getters()), and returns the report as a dict.
+    """
+    if fillers is None:
+        fillers = default_fillers()
+    if getters is None:
+        getters = default_getters()
+    db = Database(db_schema=schema, **conninfo)
+    try:
+        if clean:
+            db.clean_db()
+        db.init_db()
+        recorder = BenchmarkRecorder(db=db)
+        recorder.run_fillers(fillers)
+        recorder.run_getters(getters, repeat=repeat)
+        return build_report(db=db, results=recorder.results, **extra_info)
+    finally:
+        db.close()
+
+
+def compare_reports(old, new):
+    """
+    Returns, for each stage present in both reports, old and new seconds (summed over repetitions) and their ratio new/old
+    """
+
+    def seconds(report):
+        ans = dict()
+        for r in report["results"]:
+            ans[r["name"]] = ans.get(r["name"], 0.0) + r["seconds"]
+        return ans
+
+    old_seconds = seconds(old)
+    new_seconds = seconds(new)
+    return [
+        dict(
+            name=name,
+            old=old_seconds[name],
+            new=new_seconds[name],
+            ratio=(
+                new_seconds[name] / old_seconds[name] if old_seconds[name] else None
+            ),
+        )
+        for name in old_seconds
+        if name in new_seconds
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m gis_fillers.benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--host", default="localhost")
+    run_parser.add_argument("--port", type=int, default=5432)
+    run_parser.add_argument("--database", default="gis_fillers_benchmark")
+    run_parser.add_argument("--user", default="postgres")
+    run_parser.add_argument("--schema", default="gis_fillers_benchmark")
+    run_parser.add_argument("--data-folder", default="data_folder")
+    run_parser.add_argument("--repeat", type=int, default=1)
+    run_parser.add_argument("--no-clean", action="store_true")
+    run_parser.add_argument("--output", default=None)
+    run_parser.add_argument("--synthetic-zones", type=int, default=None)
+    run_parser.add_argument("--synthetic-vertices", type=int, default=1)
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        extra_info = dict()
+        if args.synthetic_zones is not None:
+            synthetic.SyntheticDataGenerator(
+                zones_scale=args.synthetic_zones,
+                vertices_scale=args.synthetic_vertices,
+            ).generate(args.data_folder)
+            extra_info["synthetic"] = dict(
+                zones_scale=args.synthetic_zones,
+                vertices_scale=args.synthetic_vertices,
+            )
+        report = run_benchmarks(
+            conninfo=dict(
+                host=args.host,
+                port=args.port,
+                database=args.database,
+                user=args.user,
+                data_folder=args.data_folder,
+            ),
+            schema=args.schema,
+            repeat=args.repeat,
+            clean=not args.no_clean,
+            data_folder=os.path.abspath(args.data_folder),
+            **extra_info,
+        )
+        if args.output is None:
+            json.dump(report, sys.stdout, indent=2)
+        else:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+    else:
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        for c in compare_reports(old, new):
+            ratio = "n/a" if c["ratio"] is None else f"{c['ratio']:.2f}x"
+            print(f"{c['name']:<50} {c['old']:>10.3f}s {c['new']:>10.3f}s {ratio:>8}")
+
+
+if __name__ == "__main__":
+    main()
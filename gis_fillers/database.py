@@ -5,8 +5,10 @@ import copy
 import logging
 import csv
 import hashlib
+import contextlib
 import numpy as np
 from . import MetaFiller
+from . import pool
 
 from db_fillers import Database as TemplateDatabase
 
@@ -42,8 +44,17 @@ class Database(TemplateDatabase):
     This class creates a database object with the main structure, with a few methods  to manipulate it.
     To fill it, fillers are used (see Filler class).
     The object uses a specific data folder and a list of files used for the fillers, with name, keyword, and potential download link. (move to filler class?)
+
+    Besides its own connection, the database gives access to a connection pool shared by all Database objects of the same PostgreSQL database
+    (see pool.ConnectionPool): checkout yields a copy of the object working on its own pooled connection, to run fillers or getters concurrently
+    from threads or tasks. gis_db, held for the lifetime of the object, has its own dedicated connection (see dedicated_copy)
+    so that it never takes a slot of the pool; close closes both.
     """
 
+    pool_minconn = 1
+    pool_maxconn = 10
+    pool_timeout = 60.0
+
     def clean_db(self, gis_data_stay=False, commit=True, extra_whitelist=[], **kwargs):
         if gis_data_stay:
             extra_whitelist += [
@@ -57,11 +68,116 @@ class Database(TemplateDatabase):
             self, commit=commit, extra_whitelist=extra_whitelist, **kwargs
         )
 
+    @property
+    def connection_pool(self):
+        return pool.get_connection_pool(
+            self.db_conninfo,
+            minconn=self.pool_minconn,
+            maxconn=self.pool_maxconn,
+            timeout=self.pool_timeout,
+        )
+
+    @property
+    def search_path(self):
+        return pool.parse_search_path(self.db_conninfo.get("options"))
+
+    def pooled_copy(self, schema=None):
+        """
+        Returns a copy of the database using its own connection from the shared pool, to be given back with release_pooled.
+        With schema, the copy works in this schema first (created if needed), followed by the search path of the database.
+        Fillers are not copied.
+        """
+        search_path = self.schema_search_path(schema=schema)
+        connection = self.connection_pool.getconn(search_path=search_path)
+        return self.connected_copy(
+            connection=connection, search_path=search_path, schema=schema
+        )
+
+    def dedicated_copy(self, schema=None):
+        """
+        Same as pooled_copy, but with a new connection outside of the pool, to be closed with close
+        """
+        search_path = self.schema_search_path(schema=schema)
+        conninfo = {k: v for k, v in self.db_conninfo.items() if k != "options"}
+        if search_path:
+            conninfo["options"] = (
+                f"-c search_path={pool.format_search_path(search_path)}"
+            )
+        connection = psycopg2.connect(**conninfo)
+        return self.connected_copy(
+            connection=connection, search_path=search_path, schema=schema
+        )
+
+    def schema_search_path(self, schema=None):
+        """
+        Search path of the database, with schema first if given
+        """
+        search_path = self.search_path
+        if schema is not None:
+            self.check_sqlname_safe(schema)
+            search_path = [schema] + [s for s in search_path if s != schema]
+        return search_path
+
+    def connected_copy(self, connection, search_path, schema=None):
+        """
+        Returns a copy of the database working on connection, see pooled_copy
+        """
+        db = copy.copy(self)
+        db.__dict__.pop("gis_db", None)
+        db.connection = connection
+        db.cursor = connection.cursor()
+        db.fillers = []
+        db.db_conninfo = copy.deepcopy(self.db_conninfo)
+        if search_path:
+            db.db_conninfo["options"] = (
+                f"-c search_path={pool.format_search_path(search_path)}"
+            )
+        if schema is not None:
+            db.cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}";')
+            db.connection.commit()
+        return db
+
+    def release_pooled(self):
+        """
+        Gives the connection of a copy made by pooled_copy back to the pool (uncommitted changes are rolled back)
+        """
+        self.cursor.close()
+        self.connection_pool.putconn(self.connection)
+
+    @contextlib.contextmanager
+    def checkout(self, schema=None):
+        """
+        Context manager yielding a pooled copy of the database (see pooled_copy), for a thread or a task:
+
+        with db.checkout() as task_db:
+            getter.get_result(db=task_db)
+        """
+        db = self.pooled_copy(schema=schema)
+        try:
+            yield db
+        finally:
+            db.release_pooled()
+
+    def release_gis_db(self):
+        """
+        Closes the connection of gis_db, if any
+        """
+        if hasattr(self, "gis_db"):
+            self.gis_db.close()
+            del self.gis_db
+
+    def close(self):
+        """
+        Closes the connection of the database and of its gis_db
+        """
+        self.release_gis_db()
+        if not self.connection.closed:
+            self.connection.close()
+
     def get_gis_db(self, schema="postgis", replace=False, fill_db=True, force=False):
         if not hasattr(self, "gis_db") or replace:
-            conninfo = copy.deepcopy(self.db_conninfo)
-            conninfo["db_schema"] = schema
-            self.gis_db = Database(**conninfo)
+            self.release_gis_db()
+            self.gis_db = self.dedicated_copy(schema=schema)
             self.gis_db.init_db()
             if fill_db:
                 self.gis_db.cursor.execute("SELECT 1 FROM geonames_zipcodes LIMIT 1;")
@@ -70,3 +186,36 @@ class Database(TemplateDatabase):
                     self.gis_db.fill_db()
                     self.gis_db.connection.commit()
         return self.gis_db
+
+    def get_data_version(self, zone_levels=()):
+        """
+        Returns a token identifying the state of the data of the given zone levels.
+        It changes whenever a filler registers a modification of one of them (see Filler.register_zone_levels).
+        Levels without any registered modification (and empty zone_levels) fall back to the last filler run, whatever it modified.
+        """
+        zone_levels = sorted(set(zone_levels))
+        self.cursor.execute(
+            """
+            SELECT zone_level,filler_info,updated_at FROM _zone_levels_info
+            WHERE zone_level=ANY(%(zone_levels)s)
+            ;""",
+            {"zone_levels": zone_levels},
+        )
+        versions = {
+            zl: f"{fi}_{ua.isoformat()}" for zl, fi, ua in self.cursor.fetchall()
+        }
+        if len(zone_levels) == 0 or len(versions) < len(zone_levels):
+            self.cursor.execute(
+                """
+                SELECT id,exec_date FROM _fillers_info
+                WHERE status='end_apply'
+                ORDER BY id DESC LIMIT 1
+                ;"""
+            )
+            ans = self.cursor.fetchone()
+            last_run = None if ans is None else f"{ans[0]}_{ans[1].isoformat()}"
+            if len(zone_levels) == 0:
+                return f"*:{last_run}"
+            for zl in zone_levels:
+                versions.setdefault(zl, last_run)
+        return ",".join(f"{zl}:{versions[zl]}" for zl in zone_levels)
@@ -1,2 +1,3 @@
 from .fillers import Filler
 from .metafiller import MetaFiller
+from . import instrumentation
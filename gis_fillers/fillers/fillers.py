@@ -1,12 +1,40 @@
 from db_fillers import Filler as TemplateFiller
 from .loc_resolver import LocationResolver
+from . import instrumentation
+import os
 import copy
+from psycopg2 import extras
 
 
 class Filler(TemplateFiller):
+    """
+    With instrument=True (implied by stats_callback or metrics_file), prepare, apply and fill_* methods are measured once the filler
+    is added to a database: wall time, rows produced, bytes of source files read (files passed to record_file or count_bytes_read)
+    and, with track_memory=True, peak Python memory, written to _fillers_stats, passed to stats_callback and to the OpenMetrics file
+    metrics_file (see instrumentation.FillerRecorder).
+    Rows produced are counted with a COUNT(*) of each table of instrumentation.COUNTED_TABLES before and after prepare and apply only
+    (rows of fill_* steps are None), full scans that are not included in the measured times;
+    memory tracking (tracemalloc) slows down allocation-heavy steps.
+    """
+
     def __init__(
-        self, loc_resolve=True, loc_db="postgis", loc_resolver_args=[], **kwargs
+        self,
+        loc_resolve=True,
+        loc_db="postgis",
+        loc_resolver_args=[],
+        instrument=False,
+        stats_callback=None,
+        metrics_file=None,
+        track_memory=False,
+        **kwargs,
     ):
+        self.instrumented = (
+            instrument or stats_callback is not None or metrics_file is not None
+        )
+        self.stats_callback = stats_callback
+        self.metrics_file = metrics_file
+        self.track_memory = track_memory
+        self.recorder = None
         self.loc_resolve = loc_resolve
         self.loc_db = loc_db
         if isinstance(loc_resolver_args, dict):
@@ -15,8 +43,62 @@ class Filler(TemplateFiller):
         TemplateFiller.__init__(self, **kwargs)
 
     def after_insert(self):
+        if self.instrumented and self.recorder is None:
+            instrumentation.FillerRecorder(
+                db=self.db,
+                callback=self.stats_callback,
+                metrics_file=self.metrics_file,
+                track_memory=self.track_memory,
+            ).instrument_filler(self)
         if self.loc_resolve:
             for lr_args in self.loc_resolver_args:
                 if isinstance(self.loc_db, str):
                     self.loc_db = self.db.get_gis_db(schema=self.loc_db)
                 self.db.add_filler(LocationResolver(source_db=self.loc_db, **lr_args))
+
+    def instrumentation_args(self):
+        """
+        Instrumentation arguments, for fillers added by this one
+        """
+        return dict(
+            instrument=self.instrumented,
+            stats_callback=self.stats_callback,
+            metrics_file=self.metrics_file,
+            track_memory=self.track_memory,
+        )
+
+    def record_file(self, filename, filecode, folder=None, **kwargs):
+        if folder is None:
+            folder = self.data_folder
+        self.db.record_file(
+            folder=folder, filename=filename, filecode=filecode, **kwargs
+        )
+        self.count_bytes_read(filename=filename, folder=folder)
+
+    def count_bytes_read(self, filename, folder=None):
+        """
+        Adds the size of a source file to the bytes read by the current steps, if the filler is instrumented
+        """
+        if self.recorder is not None:
+            if folder is None:
+                folder = self.data_folder
+            self.recorder.add_bytes_read(
+                os.path.getsize(os.path.join(folder, filename))
+            )
+
+    def register_zone_levels(self, *zone_levels):
+        """
+        Records that the zones, geometries or attributes of these zone levels have been modified by this filler run.
+        This changes their data version (see Database.get_data_version), invalidating cached getter results for these levels only.
+        """
+        extras.execute_batch(
+            self.db.cursor,
+            """
+            INSERT INTO _zone_levels_info(zone_level,filler_info,updated_at)
+                VALUES(%(zone_level)s,(SELECT MAX(id) FROM _fillers_info),clock_timestamp())
+                ON CONFLICT (zone_level) DO UPDATE
+                SET filler_info=EXCLUDED.filler_info,updated_at=EXCLUDED.updated_at
+            ;""",
+            ({"zone_level": zl} for zl in zone_levels),
+        )
+        self.db.connection.commit()
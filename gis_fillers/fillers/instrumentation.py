@@ -0,0 +1,258 @@
+import os
+import time
+import datetime
+import threading
+import contextlib
+import tracemalloc
+from collections import OrderedDict
+from psycopg2 import extras
+
+# tables whose row count changes are reported as rows produced by filler steps
+COUNTED_TABLES = (
+    "zones",
+    "zone_parents",
+    "gis_data",
+    "zone_attributes",
+    "geonames_zipcodes",
+    "plz_gemeinde",
+)
+
+
+def count_rows(db, tables=COUNTED_TABLES):
+    ans = 0
+    for table in tables:
+        db.cursor.execute(f"SELECT COUNT(*) FROM {table};")
+        ans += db.cursor.fetchone()[0]
+    return ans
+
+
+class StepRecorder(object):
+    """
+    Records measurements of named steps in results (list of dicts: name, kind, status, started_at, seconds, rows, rows_per_sec, bytes_read, peak_memory).
+    Steps can be nested (e.g. apply and the fill_* methods it calls), each one reporting its own peak memory (tracemalloc, above the level
+    at the start of the step, None unless track_memory), bytes read from source files (see add_bytes_read) and rows produced (net change
+    of the row count of tables, for steps of a kind in count_kinds), nested steps included.
+    Row counts run a COUNT(*) on each table before and after a counted step, i.e. full scans whose cost grows with the tables:
+    only outermost steps are counted unless count_nested (rows of nested steps are then None), and pass tables=() to skip them.
+    The time spent counting is not included in the seconds of enclosing steps.
+    """
+
+    def __init__(
+        self,
+        db,
+        tables=COUNTED_TABLES,
+        count_kinds=("filler",),
+        track_memory=True,
+        count_nested=False,
+    ):
+        self.db = db
+        self.tables = tables
+        self.count_kinds = count_kinds
+        self.track_memory = track_memory
+        self.count_nested = count_nested
+        self.results = []
+        self.stack = []
+        self.started_tracing = False
+
+    def add_bytes_read(self, nb_bytes):
+        for frame in self.stack:
+            frame["bytes_read"] += nb_bytes
+
+    def record_done(self, record):
+        self.results.append(record)
+
+    def count_rows(self):
+        """
+        Row count of tables, the time spent being excluded from the steps in progress
+        """
+        start = time.perf_counter()
+        ans = count_rows(self.db, tables=self.tables)
+        elapsed = time.perf_counter() - start
+        for frame in self.stack:
+            frame["overhead"] += elapsed
+        return ans
+
+    @contextlib.contextmanager
+    def measure(self, name, kind, **info):
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1]["peak"] = max(self.stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+        else:
+            current = 0
+        record = dict(name=name, kind=kind, **info, status="done", rows=None)
+        count = (
+            kind in self.count_kinds
+            and len(self.tables) > 0
+            and (self.count_nested or not self.stack)
+        )
+        rows_before = self.count_rows() if count else None
+        frame = dict(start_memory=current, peak=current, bytes_read=0, overhead=0.0)
+        self.stack.append(frame)
+        record["started_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record["status"] = "failed"
+            raise
+        finally:
+            seconds = time.perf_counter() - start - frame["overhead"]
+            self.stack.pop()
+            if self.track_memory:
+                peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                if self.stack:
+                    self.stack[-1]["peak"] = max(self.stack[-1]["peak"], peak)
+                elif self.started_tracing:
+                    tracemalloc.stop()
+                    self.started_tracing = False
+                peak_memory = peak - frame["start_memory"]
+            else:
+                peak_memory = None
+            if rows_before is not None and record["status"] == "done":
+                record["rows"] = self.count_rows() - rows_before
+            record.update(
+                seconds=seconds,
+                rows_per_sec=(
+                    None
+                    if record["rows"] is None or seconds == 0
+                    else record["rows"] / seconds
+                ),
+                bytes_read=frame["bytes_read"],
+                peak_memory=peak_memory,
+            )
+            self.record_done(record)
+
+    def wrap(self, name, kind, method, **info):
+        def wrapped(*args, **kwargs):
+            with self.measure(name=name, kind=kind, **info):
+                return method(*args, **kwargs)
+
+        return wrapped
+
+    def instrument_filler(self, filler):
+        """
+        Wraps prepare, apply and fill_* methods of a filler instance
+        """
+        prefix = filler.__class__.__name__
+        for attr in dir(filler):
+            if attr in ("prepare", "apply") or attr.startswith("fill_"):
+                method = getattr(filler, attr)
+                if callable(method):
+                    setattr(
+                        filler,
+                        attr,
+                        self.wrap(
+                            name=f"{prefix}.{attr}",
+                            kind="filler",
+                            method=method,
+                            filler=prefix,
+                            step=attr,
+                        ),
+                    )
+        filler.recorder = self
+        return filler
+
+
+class FillerRecorder(StepRecorder):
+    """
+    StepRecorder of a single filler (see Filler, instrument argument): after each top-level step (prepare or apply),
+    the measurements of its steps are written to _fillers_stats, attached to the current filler run of _fillers_info,
+    and to the OpenMetrics text file metrics_file if set. callback is called with each measurement.
+    Memory is not tracked by default, tracemalloc slowing down the filler itself.
+    """
+
+    def __init__(
+        self, db, callback=None, metrics_file=None, track_memory=False, **kwargs
+    ):
+        StepRecorder.__init__(self, db=db, track_memory=track_memory, **kwargs)
+        self.callback = callback
+        self.metrics_file = metrics_file
+        self.pending = []
+
+    def record_done(self, record):
+        StepRecorder.record_done(self, record)
+        self.pending.append(record)
+        if self.callback is not None:
+            self.callback(record)
+        if not self.stack:
+            try:
+                self.write_stats()
+                if self.metrics_file is not None:
+                    write_metrics(self.metrics_file, self.pending)
+            except Exception as e:
+                # measurements should not mask the outcome of the step itself
+                self.db.connection.rollback()
+                self.db.logger.warning(f"Could not save filler stats: {e}")
+            finally:
+                self.pending = []
+
+    def write_stats(self):
+        if self.pending[-1]["status"] == "failed":
+            self.db.connection.rollback()
+        extras.execute_batch(
+            self.db.cursor,
+            """
+            INSERT INTO _fillers_stats(filler_info,class,step,status,started_at,seconds,rows,bytes_read,peak_memory)
+                VALUES((SELECT MAX(id) FROM _fillers_info),%(filler)s,%(step)s,%(status)s,%(started_at)s,
+                    %(seconds)s,%(rows)s,%(bytes_read)s,%(peak_memory)s)
+            ;""",
+            self.pending,
+        )
+        self.db.connection.commit()
+
+
+METRICS = (
+    ("seconds", "gis_fillers_step_seconds", "seconds", "Wall time of filler steps"),
+    ("rows", "gis_fillers_step_rows", None, "Rows produced by filler steps"),
+    (
+        "bytes_read",
+        "gis_fillers_step_read_bytes",
+        "bytes",
+        "Bytes of source files read by filler steps",
+    ),
+    (
+        "peak_memory",
+        "gis_fillers_step_peak_memory_bytes",
+        "bytes",
+        "Peak Python memory of filler steps",
+    ),
+)
+
+_metrics_values = dict()
+_metrics_lock = threading.Lock()
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_metrics(path, records):
+    """
+    Writes the last measurement of each filler step recorded in path during the process (all fillers sharing this file),
+    in the OpenMetrics text format (e.g. for the node_exporter textfile collector). The file is replaced atomically.
+    """
+    with _metrics_lock:
+        values = _metrics_values.setdefault(path, OrderedDict())
+        for r in records:
+            values[(r["filler"], r["step"])] = r
+        lines = []
+        for key, metric, unit, help_text in METRICS:
+            lines.append(f"# TYPE {metric} gauge")
+            if unit is not None:
+                lines.append(f"# UNIT {metric} {unit}")
+            lines.append(f"# HELP {metric} {help_text}")
+            for (filler, step), r in values.items():
+                if r[key] is not None:
+                    lines.append(
+                        f'{metric}{{filler="{escape_label(filler)}",step="{escape_label(step)}"}} {r[key]}'
+                    )
+        lines.append("# EOF")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
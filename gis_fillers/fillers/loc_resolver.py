@@ -1,11 +1,48 @@
 from db_fillers import Filler
+import io
 import copy
+import string
+import random
 from psycopg2 import extras
 
 from ..getters import generic_getters
 
 
+def csv_line(values):
+    """
+    Formats a row for COPY ... WITH (FORMAT csv): None as an unquoted empty field (NULL), numbers as is, other values quoted
+    """
+    fields = []
+    for v in values:
+        if v is None:
+            fields.append("")
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            fields.append(repr(float(v)) if isinstance(v, float) else str(v))
+        else:
+            fields.append('"' + str(v).replace('"', '""') + '"')
+    return ",".join(fields) + "\n"
+
+
 class LocationResolver(Filler):
+    """
+    Fills geom_col of the rows of query_table where it is NULL, resolving the location columns with a getter (resolver_class).
+
+    By default, all rows are resolved in prepare and written in apply.
+    With chunk_size, rows are walked by id columns (keyset pagination) in apply, each chunk being resolved, written and committed on its own:
+    memory is bounded by chunk_size, progress is kept in self.progress (and passed to progress_callback if given),
+    and as resolved rows do not match geom_col IS NULL anymore, a restarted run continues where the previous one stopped.
+
+    With server_side, zipcode and area resolvers run as a single UPDATE ... FROM join in the database instead of going through Python,
+    source_db being the same database as the filler's (its tables reachable through the search path, or in source_schema if given).
+    Zip codes are joined to geonames_zipcodes, countries being converted to alpha_2 codes through a temporary lookup table;
+    areas get a point drawn with ST_GeneratePoints in the geometry of their zone.
+
+    With distinct_locations (default for all resolvers but area, whose rows each get their own random point),
+    only distinct location tuples are passed to the resolver, and results are written back with a join on the location columns,
+    so that geocoding and writes scale with the number of distinct locations.
+    Results are written by COPYing them to a temporary staging table, applied with a single UPDATE ... FROM join (see update_from_staging).
+    """
+
     def __init__(
         self,
         source_db,
@@ -15,9 +52,27 @@ class LocationResolver(Filler):
         geom_col="geom",
         resolver_class="address",
         resolver_args=dict(),
+        chunk_size=None,
+        progress_callback=None,
+        server_side=False,
+        source_schema=None,
+        distinct_locations=None,
         **kwargs,
     ):
         self.source_db = source_db
+        self.server_side = server_side
+        self.source_schema = source_schema
+        if server_side and resolver_class not in ("zipcode", "area"):
+            raise ValueError(
+                "server_side resolution is only available for resolver_class 'zipcode' or 'area'"
+            )
+        if server_side and chunk_size is not None:
+            raise ValueError(
+                "server_side resolution runs in a single statement, chunk_size cannot be used"
+            )
+        self.resolver_name = resolver_class
+        self.chunk_size = chunk_size
+        self.progress_callback = progress_callback
         if isinstance(id_col, str):
             self.id_columns = (id_col,)
         else:
@@ -41,18 +96,51 @@ class LocationResolver(Filler):
             )
         else:
             self.resolver_class = resolver_class
+        if distinct_locations is None:
+            distinct_locations = not issubclass(
+                self.resolver_class, generic_getters.AreaPointsGetter
+            )
+        self.distinct_locations = distinct_locations
         self.resolver_args = copy.deepcopy(resolver_args)
 
     def check_sql(self):
-        for var in (self.query_table, self.geom_col, *self.loc_columns):
+        for var in (
+            self.query_table,
+            self.geom_col,
+            *self.loc_columns,
+            *self.id_columns,
+        ):
             self.check_sql_safe(var)
+        if self.source_schema is not None:
+            self.check_sql_safe(self.source_schema)
 
     def prepare(self):
         self.check_sql()
-        self.get_locations()
+        if self.server_side:
+            self.check_same_database()
+        elif self.chunk_size is None:
+            self.get_locations(distinct=self.distinct_locations)
+            self.resolve_locations(self.location_info)
+        else:
+            self.db.cursor.execute(
+                f"SELECT COUNT(*) FROM {self.query_table} WHERE {self.geom_col} IS NULL;"
+            )
+            self.progress = dict(
+                total=self.db.cursor.fetchone()[0],
+                processed=0,
+                resolved=0,
+                chunks=0,
+                last_id=None,
+            )
+
+    def resolve_locations(self, location_info):
+        """
+        Adds geo_lat and geo_long values to the elements of location_info
+        """
+        location_list = [l["loc_list"] for l in location_info]
         resolver = self.resolver_class(
             db=self.source_db,
-            location_list=self.location_list,
+            location_list=location_list,
             **self.resolver_args,
         )
         results = resolver.get_result(raw_data=True)
@@ -62,24 +150,50 @@ class LocationResolver(Filler):
             elif col == "long":
                 long_idx = i
         assert len(results) == len(
-            self.location_list
-        ), f"Mismatch between results length{len(results)} and expected length {len(self.location_list)}"
-        for res, loc in zip(results, self.location_info):
+            location_list
+        ), f"Mismatch between results length{len(results)} and expected length {len(location_list)}"
+        for res, loc in zip(results, location_info):
             if isinstance(res, tuple):
                 loc["geo_lat"] = res[lat_idx]
                 loc["geo_long"] = res[long_idx]
             else:
                 loc["geo_lat"] = res["lat"]
                 loc["geo_long"] = res["long"]
-            for idval, idc in zip(loc["id_list"], self.id_columns):
-                loc[idc] = idval
 
-    def get_locations(self):
+    def get_locations(self, after=None, limit=None, distinct=False):
+        """
+        Sets location_info to the rows with geom_col NULL, or if limit is given to the next limit of them by id columns, after the id tuple after.
+        With distinct, to the distinct location tuples of the rows with geom_col NULL (without ids, limit and after are not used).
+        """
+        if distinct:
+            self.db.cursor.execute(
+                f"""
+    			SELECT DISTINCT {','.join(self.loc_columns)} FROM {self.query_table}
+    			WHERE {self.geom_col} IS NULL
+    			"""
+            )
+            self.location_info = [
+                dict(id_list=(), loc_list=r) for r in self.db.cursor.fetchall()
+            ]
+            self.location_list = [l["loc_list"] for l in self.location_info]
+            return
+        ids = ",".join(self.id_columns)
+        if after is None:
+            keyset_condition = ""
+        else:
+            keyset_condition = f"AND ({ids})>({','.join(['%s'] * len(after))})"
+        if limit is None:
+            limit_clause = ""
+        else:
+            limit_clause = f"ORDER BY {ids} LIMIT {int(limit)}"
         self.db.cursor.execute(
             f"""
-    		SELECT {','.join(self.id_columns)},{','.join(self.loc_columns)} FROM {self.query_table}
+    		SELECT {ids},{','.join(self.loc_columns)} FROM {self.query_table}
     		WHERE {self.geom_col} IS NULL
-    		"""
+    		{keyset_condition}
+    		{limit_clause}
+    		""",
+            after,
         )
 
         self.location_info = [
@@ -92,14 +206,257 @@ class LocationResolver(Filler):
         self.location_list = [l["loc_list"] for l in self.location_info]
 
     def apply(self):
-        extras.execute_batch(
-            self.db.cursor,
+        if self.server_side:
+            self.apply_server_side()
+        elif self.chunk_size is None:
+            self.write_locations(self.location_info)
+        else:
+            self.apply_chunked()
+
+    def write_locations(self, location_info):
+        """
+        Writes resolved locations, by location columns if distinct_locations else by ids. Returns the number of rows updated.
+        """
+        if self.distinct_locations:
+            return self.update_distinct_locations(location_info)
+        else:
+            return self.update_locations(location_info)
+
+    def apply_chunked(self):
+        while True:
+            self.get_locations(after=self.progress["last_id"], limit=self.chunk_size)
+            if not self.location_info:
+                break
+            if self.distinct_locations:
+                chunk_info = [
+                    dict(id_list=(), loc_list=loc)
+                    for loc in dict.fromkeys(l["loc_list"] for l in self.location_info)
+                ]
+            else:
+                chunk_info = self.location_info
+            self.resolve_locations(chunk_info)
+            updated = self.write_locations(chunk_info)
+            self.progress["resolved"] += updated
+            if self.distinct_locations:
+                # rows of later chunks sharing resolved locations are updated too (and skipped when reached): they count as processed now
+                unresolved = set(
+                    l["loc_list"] for l in chunk_info if l["geo_lat"] is None
+                )
+                self.progress["processed"] += updated + sum(
+                    l["loc_list"] in unresolved for l in self.location_info
+                )
+            else:
+                self.progress["processed"] += len(self.location_info)
+            self.progress["chunks"] += 1
+            self.progress["last_id"] = tuple(self.location_info[-1]["id_list"])
+            self.logger.info(
+                f"Resolved {self.progress['resolved']} locations, processed {self.progress['processed']}/{self.progress['total']}"
+            )
+            if self.progress_callback is not None:
+                self.progress_callback(dict(self.progress))
+        self.location_info = []
+
+    def update_locations(self, location_info):
+        """
+        Writes resolved locations by ids: (ids..., long, lat) rows are copied to a staging table and applied with a single UPDATE ... FROM join.
+        Rows unresolved or whose geom_col is not NULL anymore are skipped.
+        """
+        values = [
+            (*l["id_list"], l["geo_long"], l["geo_lat"])
+            for l in location_info
+            if l["geo_lat"] is not None
+        ]
+        updated = self.update_from_staging(key_columns=self.id_columns, values=values)
+        self.logger.info(
+            f"Updated {updated} rows of {self.query_table}, skipped {len(location_info)-updated}"
+        )
+        return updated
+
+    def update_distinct_locations(self, location_info):
+        """
+        Writes resolved distinct locations, fanned out to query_table with a join on the location columns
+        """
+        values = [
+            (*l["loc_list"], l["geo_long"], l["geo_lat"])
+            for l in location_info
+            if l["geo_lat"] is not None
+        ]
+        updated = self.update_from_staging(
+            key_columns=self.loc_columns, values=values, null_safe=True
+        )
+        self.logger.info(
+            f"Updated {updated} rows of {self.query_table} from {len(values)} distinct locations, skipped {len(location_info)-len(values)} unresolved locations"
+        )
+        return updated
+
+    def update_from_staging(self, key_columns, values, null_safe=False):
+        """
+        Copies values (key_columns..., long, lat) to a temporary staging table, typed like the key columns of query_table,
+        and sets geom_col of the matching rows of query_table where it is NULL. Returns the number of rows updated.
+        With null_safe, NULL keys match NULL values (as with IS NOT DISTINCT FROM): one UPDATE is run per combination of NULL keys
+        present in values, joining on the other keys with =, so that the join can still be hashed.
+        """
+        if not values:
+            return 0
+        rnd_str = "".join(
+            random.choice(string.ascii_letters + string.digits) for _ in range(10)
+        )
+        staging_table = f"temp_resolved_locations_{rnd_str}"
+        key_cols = ",".join(key_columns)
+        self.db.cursor.execute(
             f"""
+    		CREATE TEMP TABLE {staging_table} ON COMMIT DROP AS
+    		SELECT {key_cols} FROM {self.query_table} LIMIT 0;
+    		ALTER TABLE {staging_table} ADD COLUMN geo_long DOUBLE PRECISION, ADD COLUMN geo_lat DOUBLE PRECISION;
+    		"""
+        )
+        self.db.cursor.copy_expert(
+            f"COPY {staging_table}({key_cols},geo_long,geo_lat) FROM STDIN WITH (FORMAT csv)",
+            io.StringIO("".join(csv_line(v) for v in values)),
+        )
+        if null_safe:
+            null_patterns = set(
+                tuple(v is None for v in val[: len(key_columns)]) for val in values
+            )
+        else:
+            null_patterns = [(False,) * len(key_columns)]
+        updated = 0
+        for null_pattern in null_patterns:
+            conditions = []
+            for kc, is_null in zip(key_columns, null_pattern):
+                if is_null:
+                    conditions.append(
+                        f"{self.query_table}.{kc} IS NULL AND s.{kc} IS NULL"
+                    )
+                elif null_safe:
+                    conditions.append(
+                        f"{self.query_table}.{kc}=s.{kc} AND s.{kc} IS NOT NULL"
+                    )
+                else:
+                    conditions.append(f"{self.query_table}.{kc}=s.{kc}")
+            self.db.cursor.execute(
+                f"""
     		UPDATE {self.query_table}
-    		SET {self.geom_col}=ST_SetSRID(ST_MakePoint(%(geo_long)s,%(geo_lat)s),4326)
-    		WHERE {' AND '.join([f'{idc}=%({idc})s' for idc in self.id_columns])}
-    		AND {self.geom_col} IS NULL
-    		""",
-            self.location_info,
+    		SET {self.geom_col}=ST_SetSRID(ST_MakePoint(s.geo_long,s.geo_lat),4326)
+    		FROM {staging_table} s
+    		WHERE {' AND '.join(conditions)}
+    		AND {self.query_table}.{self.geom_col} IS NULL
+    		"""
+            )
+            updated += self.db.cursor.rowcount
+        self.db.connection.commit()
+        return updated
+
+    def check_same_database(self):
+        keys = ("host", "port", "database")
+        if any(
+            self.db.db_conninfo.get(k) != self.source_db.db_conninfo.get(k)
+            for k in keys
+        ):
+            raise ValueError(
+                "server_side resolution needs source_db to be the same database as the filler's"
+            )
+
+    def source_table(self, table):
+        if self.source_schema is None:
+            return table
+        else:
+            return f'"{self.source_schema}".{table}'
+
+    def apply_server_side(self):
+        if self.resolver_name == "zipcode":
+            self.update_zipcodes()
+        else:
+            self.update_areas()
+        self.logger.info(
+            f"Resolved {self.db.cursor.rowcount} locations of {self.query_table} server-side"
         )
         self.db.connection.commit()
+
+    def update_zipcodes(self):
+        country_format = self.resolver_args.get("country_format", "alpha_2")
+        a2code = generic_getters.get_country_converter(
+            country_format=country_format,
+            language=self.resolver_args.get("country_language"),
+        )
+        zip_col = self.loc_columns[-1]
+        if len(self.loc_columns) == 1:
+            country_condition = "gz.country_code=%(country_code)s"
+            country_join = ""
+            params = dict(country_code=a2code(self.resolver_args.get("country")))
+        else:
+            ctry_col = self.loc_columns[0]
+            rnd_str = "".join(
+                random.choice(string.ascii_letters + string.digits) for _ in range(10)
+            )
+            country_table = f"temp_country_codes_{rnd_str}"
+            self.db.cursor.execute(
+                f"""
+    			SELECT DISTINCT {ctry_col}::text FROM {self.query_table}
+    			WHERE {self.geom_col} IS NULL AND {ctry_col} IS NOT NULL
+    			"""
+            )
+            country_codes = [(ct, a2code(ct)) for (ct,) in self.db.cursor.fetchall()]
+            self.db.cursor.execute(
+                f"""
+    			CREATE TEMP TABLE {country_table}(
+    				designation TEXT PRIMARY KEY,
+    				country_code TEXT
+    				) ON COMMIT DROP;
+    			"""
+            )
+            extras.execute_values(
+                self.db.cursor,
+                f"INSERT INTO {country_table}(designation,country_code) VALUES %s",
+                country_codes,
+            )
+            # the UPDATE target cannot be referenced in the FROM joins, the country table is matched in WHERE
+            country_join = f", {country_table} cc"
+            country_condition = f"""gz.country_code=cc.country_code
+    		AND cc.designation={self.query_table}.{ctry_col}::text"""
+            params = dict()
+        self.db.cursor.execute(
+            f"""
+    		UPDATE {self.query_table}
+    		SET {self.geom_col}=gz.geom
+    		FROM {self.source_table('geonames_zipcodes')} gz{country_join}
+    		WHERE {self.query_table}.{self.geom_col} IS NULL
+    		AND gz.zip_code={self.query_table}.{zip_col}::text
+    		AND {country_condition}
+    		AND gz.geom IS NOT NULL
+    		""",
+            params,
+        )
+
+    def update_areas(self):
+        location_ref_type = self.resolver_args.get("location_ref_type", "code")
+        if location_ref_type not in ("code", "id", "name"):
+            raise ValueError(f"Unrecognized ref_type for location:{location_ref_type}")
+        self.db.cursor.execute(
+            f"""
+    		WITH zone_geoms AS (SELECT DISTINCT ON (location)
+    				COALESCE(z.{location_ref_type}::text,z.id::text) AS location,
+    				gd.geom
+    			FROM {self.source_table('zone_levels')} zl
+    			INNER JOIN {self.source_table('zones')} z
+    				ON zl.id=z.level
+    			INNER JOIN {self.source_table('gis_types')} gt
+    				ON gt.name=%(gis_type)s
+    			INNER JOIN {self.source_table('gis_data')} gd
+    				ON gd.gis_type=gt.id
+    				AND gd.zone_id=z.id
+    				AND gd.zone_level=zl.id
+    				AND NOT ST_IsEmpty(gd.geom)
+    			WHERE zl.name=%(zone_level)s
+    			ORDER BY location,z.id)
+    		UPDATE {self.query_table}
+    		SET {self.geom_col}=ST_GeometryN(ST_GeneratePoints(zg.geom,1),1)
+    		FROM zone_geoms zg
+    		WHERE {self.query_table}.{self.geom_col} IS NULL
+    		AND zg.location={self.query_table}.{self.loc_columns[0]}::text
+    		""",
+            dict(
+                zone_level=self.resolver_args.get("zone_level", "bezirk"),
+                gis_type="zaehlsprengel",
+            ),
+        )
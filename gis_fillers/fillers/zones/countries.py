@@ -96,6 +96,7 @@ class CountriesFiller(fillers.Filler):
         # filling gis data info
         self.fill_gis_countries_LB()
         self.fill_gis_countries()
+        self.register_zone_levels("country")
 
     def fill_countries(self, filename=None):
         self.logger.info("Filling countries")
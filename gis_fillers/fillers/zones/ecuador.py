@@ -123,6 +123,7 @@ class EcuadorFiller(fillers.Filler):
         # filling population data
         # if self.include_population:
         #     self.fill_population()
+        self.register_zone_levels("ecuador_parishes")
 
     # @check_empty(table='zones')
     def fill_parishes(self, filename=None):
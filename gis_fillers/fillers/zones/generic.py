@@ -74,6 +74,7 @@ class ZonesFiller(fillers.Filler):
         self.fill_gis()
 
         self.fill_zs_children()
+        self.register_zone_levels(self.zone_level)
 
     def fill_zones(self, filename=None):
         self.logger.info(f"Filling {self.zone_level}")
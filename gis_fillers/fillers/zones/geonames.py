@@ -41,6 +41,7 @@ class GeonamesFiller(fillers.Filler):
         return self.db.cursor.fetchone() == (1,)
 
     def apply(self):
+        self.count_bytes_read(filename=self.zipname)
         extras.execute_batch(
             self.db.cursor,
             """
@@ -135,6 +135,7 @@ class HexagonsFiller(fillers.Filler):
         self.fill_hexagons()
         self.fill_parents()
         self.fill_children()
+        self.register_zone_levels(self.zone_level)
 
     def fill_hexagons(self):
         self.get_hexagons()
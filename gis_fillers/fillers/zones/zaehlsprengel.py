@@ -27,6 +27,8 @@ class ZaehlsprengelFiller(fillers.Filler):
     The simplified attribute is used to tell the filler to preprocess the shapefile and simplify the edges with mapshaper/topojson
     """
 
+    zone_levels = ("zaehlsprengel", "gemeinde", "bezirk", "bundesland", "country")
+
     def __init__(
         self,
         gis_info="https://data.statistik.gv.at/data/OGDEXT_ZSP_1_STATISTIK_AUSTRIA_{YEAR}0101.zip",
@@ -165,6 +167,7 @@ class ZaehlsprengelFiller(fillers.Filler):
         # filling population data
         if self.include_population:
             self.fill_population()
+        self.register_zone_levels(*self.zone_levels)
 
     # @check_empty(table='zones')
     def fill_zs(self, filename=None):
@@ -196,6 +199,7 @@ class ZaehlsprengelFiller(fillers.Filler):
         self.logger.info("Filling population data")
         if filename is None:
             filename = self.pop_info_name + ".csv"
+        self.count_bytes_read(filename=filename)
         self.db.cursor.execute(
             """INSERT INTO zone_attribute_types(name) VALUES('zs_population') ON CONFLICT DO NOTHING;"""
         )
@@ -734,6 +738,7 @@ class PopulationZSFiller(ZaehlsprengelFiller):
     def apply(self):
         if self.force or not self.check_done():
             self.fill_population()
+            self.register_zone_levels(*self.zone_levels)
 
     def check_done(self):
         self.db.cursor.execute(
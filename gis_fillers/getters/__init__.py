@@ -1 +1,2 @@
 from .generic_getters import Getter, GISGetter
+from .cache import GetterCache
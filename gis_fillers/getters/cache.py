@@ -0,0 +1,108 @@
+import os
+import glob
+import json
+import hashlib
+
+
+class GetterCache(object):
+    """
+    On-disk cache for getter results, e.g. GISGetter results stored as GeoParquet files, or vector tiles of MVTGetter.
+    Getters define the file extension (cache_extension) and the serialization (write_cached_result, read_cached_result).
+
+    Entries are keyed by getter class, query, query attributes, database and data version of the zone levels the getter depends on (see Database.get_data_version).
+    A filler run only changes the data version of the zone levels it modifies, so cached results for other levels stay valid.
+    Outdated entries are not hit anymore and end up removed by the LRU eviction, keeping the cache under max_size bytes.
+
+    Usage: PopulationGetter(zone_level="bezirk").get_result(db=db, cache=GetterCache("path/to/folder"))
+    """
+
+    def __init__(self, cache_folder, max_size=10**9):
+        self.cache_folder = cache_folder
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(self.cache_folder):
+            os.makedirs(self.cache_folder)
+
+    def get_key(self, getter, db):
+        key_info = dict(
+            getter=f"{getter.__class__.__module__}.{getter.__class__.__name__}",
+            query=getter.query(),
+            query_attributes=getter.query_attributes(),
+            columns=getter.columns,
+            db={
+                k: db.db_conninfo.get(k)
+                for k in ("host", "port", "database", "options")
+            },
+            data_version=db.get_data_version(zone_levels=getter.get_zone_levels()),
+        )
+        return hashlib.sha256(
+            json.dumps(key_info, sort_keys=True, default=str).encode("utf8")
+        ).hexdigest()
+
+    def get_path(self, key, extension):
+        return os.path.join(self.cache_folder, f"{key}.{extension}")
+
+    def get_result(self, getter, db=None, **kwargs):
+        if db is None:
+            db = getter.db
+        if db is None:
+            raise ValueError("please set a database to query from")
+        path = self.get_path(
+            key=self.get_key(getter=getter, db=db), extension=getter.cache_extension
+        )
+        if os.path.exists(path):
+            try:
+                result = getter.read_cached_result(path)
+            except FileNotFoundError:  # evicted in the meantime by another process
+                pass
+            else:
+                self.hits += 1
+                os.utime(path)  # mtime is used as last access time for eviction
+                return result
+        self.misses += 1
+        result = getter.get_result(db=db, **kwargs)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        getter.write_cached_result(result, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+        return result
+
+    def list_entries(self):
+        """
+        returns list of (last access time, size, path) of cached files, least recently used first
+        """
+        ans = []
+        for path in glob.glob(os.path.join(self.cache_folder, "*.*")):
+            if path.endswith(".tmp"):
+                continue
+            try:
+                ans.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except FileNotFoundError:
+                pass
+        return sorted(ans)
+
+    def evict(self):
+        entries = self.list_entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        for _, _, path in self.list_entries():
+            os.remove(path)
+
+    def stats(self):
+        entries = self.list_entries()
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            entries=len(entries),
+            size=sum(size for _, size, _ in entries),
+        )
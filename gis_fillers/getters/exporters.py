@@ -0,0 +1,136 @@
+import json
+import pyarrow as pa
+from pyarrow import parquet as pq
+import pyogrio
+from pyproj import CRS
+
+from .zone_getters import ZoneLevelGetter
+
+
+class ZoneLevelExporter(ZoneLevelGetter):
+    """
+    Exports a zone level, with the columns of ZoneLevelGetter, to a GeoParquet or FlatGeobuf file.
+
+    Rows are streamed from a server-side cursor chunk by chunk and WKB geometries are written as they come from the database, without decoding:
+    memory usage depends on chunk_size, not on the size of the zone level.
+    GeoParquet files get one row group per chunk, spatially ordered, and a bbox covering column (GeoParquet 1.1) so that readers can skip row groups outside of their area of interest.
+    FlatGeobuf files are spatially indexed by GDAL, and need GDAL >= 3.8 (pyogrio.write_arrow).
+    """
+
+    file_formats = {
+        "parquet": "geoparquet",
+        "geoparquet": "geoparquet",
+        "fgb": "flatgeobuf",
+        "flatgeobuf": "flatgeobuf",
+    }
+
+    def export_result(self, filepath, db=None, file_format=None, chunk_size=10**4):
+        if db is None:
+            db = self.db
+        if db is None:
+            raise ValueError("please set a database to query from")
+        if file_format is None:
+            file_format = filepath.split(".")[-1]
+        if file_format.lower() not in self.file_formats.keys():
+            raise ValueError(
+                f"Unknown export format: {file_format}. Choose from {tuple(self.file_formats.keys())}"
+            )
+        if self.file_formats[
+            file_format.lower()
+        ] == "flatgeobuf" and pyogrio.__gdal_version__ < (3, 8):
+            raise ValueError(
+                f"FlatGeobuf export needs GDAL >= 3.8, pyogrio uses GDAL {pyogrio.__gdal_version_string__}. Export to GeoParquet instead, or install pyogrio wheels (bundling a recent GDAL)"
+            )
+        self.db = db
+        self.prepare()
+        try:
+            if self.file_formats[file_format.lower()] == "geoparquet":
+                self.export_geoparquet(db=db, filepath=filepath, chunk_size=chunk_size)
+            else:
+                self.export_flatgeobuf(db=db, filepath=filepath, chunk_size=chunk_size)
+        finally:
+            self.cleanup()
+
+    def get_schema(self, bbox=True):
+        fields = [
+            ("ZoneID", pa.int64()),
+            ("code", pa.string()),
+            ("Zone", pa.string()),
+        ]
+        fields += [(attr, pa.float64()) for attr in self.attributes]
+        for pl in self.parent_levels:
+            fields += [(f"{pl}_id", pa.int64()), (f"{pl}_name", pa.string())]
+        if bbox:
+            fields.append(
+                (
+                    "bbox",
+                    pa.struct(
+                        [(c, pa.float64()) for c in ("xmin", "ymin", "xmax", "ymax")]
+                    ),
+                )
+            )
+        fields.append(("geometry", pa.binary()))
+        return pa.schema(fields)
+
+    def get_geo_metadata(self):
+        return {
+            "version": "1.1.0",
+            "primary_column": "geometry",
+            "columns": {
+                "geometry": {
+                    "encoding": "WKB",
+                    "geometry_types": [],
+                    "crs": CRS.from_epsg(4326).to_json_dict(),
+                    "covering": {
+                        "bbox": {
+                            c: ["bbox", c] for c in ("xmin", "ymin", "xmax", "ymax")
+                        }
+                    },
+                }
+            },
+        }
+
+    def iter_batches(self, db, chunk_size=10**4, bbox=True):
+        """
+        Yields pyarrow record batches built column-wise from the raw query results
+        """
+        schema = self.get_schema(bbox=bbox)
+        for query_result in self.iter_query_result(db=db, chunk_size=chunk_size):
+            col_dict = dict(zip(self.result_columns, zip(*query_result)))
+            arrays = []
+            for field in schema:
+                if field.name == "bbox":
+                    arrays.append(
+                        pa.StructArray.from_arrays(
+                            [
+                                pa.array(col_dict[c], type=pa.float64())
+                                for c in ("xmin", "ymin", "xmax", "ymax")
+                            ],
+                            fields=list(field.type),
+                        )
+                    )
+                else:
+                    arrays.append(pa.array(col_dict[field.name], type=field.type))
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def export_geoparquet(self, db, filepath, chunk_size=10**4):
+        schema = self.get_schema(bbox=True).with_metadata(
+            {"geo": json.dumps(self.get_geo_metadata())}
+        )
+        with pq.ParquetWriter(filepath, schema=schema) as writer:
+            for batch in self.iter_batches(db=db, chunk_size=chunk_size, bbox=True):
+                writer.write_batch(batch.replace_schema_metadata(schema.metadata))
+
+    def export_flatgeobuf(self, db, filepath, chunk_size=10**4):
+        schema = self.get_schema(bbox=False)
+        reader = pa.RecordBatchReader.from_batches(
+            schema, self.iter_batches(db=db, chunk_size=chunk_size, bbox=False)
+        )
+        pyogrio.write_arrow(
+            reader,
+            filepath,
+            driver="FlatGeobuf",
+            geometry_name="geometry",
+            geometry_type="Unknown",
+            crs="EPSG:4326",
+        )
@@ -2,13 +2,17 @@ from db_fillers import Getter
 import string
 import random
 from psycopg2 import extras
+import numpy as np
+import pandas as pd
 import shapely
 import geopandas as gpd
 import geopy
 from geopy.geocoders import Nominatim
 from shapely.geometry import Point
-from shapely.affinity import translate
+from . import geocoding
 import gettext
+import functools
+import contextlib
 import pycountry
 
 
@@ -28,78 +32,390 @@ def get_countries_info(language=None):
     return ans
 
 
+@functools.lru_cache(maxsize=None)
+def get_country_index(language=None):
+    """
+    Returns a dict per country_format (alpha_2, alpha_3, numeric, name, any) mapping casefolded country designations to alpha_2 codes.
+    name covers names, common and official names, in English and translated in language if given; any covers all of them.
+    Built once per language.
+    """
+    if language is None:
+        translate = None
+    else:
+        translate = gettext.translation(
+            "iso3166-1", pycountry.LOCALES_DIR, languages=[language]
+        ).gettext
+    ans = {k: dict() for k in ("alpha_2", "alpha_3", "numeric", "name", "any")}
+    for c in pycountry.countries:
+        names = [
+            getattr(c, attr)
+            for attr in ("name", "common_name", "official_name")
+            if hasattr(c, attr)
+        ]
+        if translate is not None:
+            names = [translate(n) for n in names] + names
+        for country_format, values in (
+            ("alpha_2", [c.alpha_2]),
+            ("alpha_3", [c.alpha_3]),
+            ("numeric", [c.numeric, str(int(c.numeric))]),
+            ("name", names),
+        ):
+            for v in values:
+                ans[country_format].setdefault(v.casefold(), c.alpha_2)
+                ans["any"].setdefault(v.casefold(), c.alpha_2)
+    return ans
+
+
+def get_country_converter(country_format="alpha_2", language=None):
+    """
+    Returns a function converting a country designation in country_format to its alpha_2 code (None if unknown).
+    alpha_2 values are truncated to 2 characters.
+    """
+    if country_format == "alpha_2":
+
+        def a2code(ct):
+            return ct[:2] if isinstance(ct, str) else ct
+
+    elif country_format in ("alpha_3", "numeric", "name", "any"):
+        country_index = get_country_index(language=language)[country_format]
+
+        def a2code(ct):
+            if ct is None:
+                return
+            else:
+                return country_index.get(str(ct).casefold())
+
+    else:
+        raise ValueError(
+            f"country_format: {country_format} unknown. Choose from (alpha_2,alpha_3,numeric,name,any)"
+        )
+    return a2code
+
+
+def wkb_to_geoms(wkb_list):
+    """
+    Decodes WKB values (as returned by psycopg2 for ST_AsBinary, or None) into an array of shapely geometries, in one vectorized call
+    """
+    return shapely.from_wkb(
+        np.array([None if g is None else bytes(g) for g in wkb_list], dtype=object)
+    )
+
+
 class GISGetter(Getter):
+    """
+    Mother class for getters returning geopandas dataframes.
+    Queries return geometries as WKB (ST_AsBinary), in the column order given by result_columns.
+    Results are parsed column-wise: geometries are decoded in a single shapely.from_wkb call, and children classes can derive extra columns in transform_columns.
+
+    Results are fetched in chunks through a server-side cursor: iter_result yields them one by one, get/get_result concatenates them.
+
+    If cacheable, results can be stored in a GetterCache passed to get_result.
+
+    With pooled, get_result and iter_result run on a connection checked out from the pool of the database (see Database.checkout)
+    instead of the connection of the database itself, so that getters can be run concurrently from threads sharing one Database object.
+    The getter itself keeps state while running (db, temporary tables): use one getter instance per thread.
+    """
+
     columns = ("geometry",)
+    result_columns = ("geometry",)
+    geometry_column = "geometry"
+    cacheable = True
+    cache_extension = "parquet"
 
-    def get(self, db, raw_data=False, **kwargs):
-        db.cursor.execute(self.query(), self.query_attributes())
-        query_result = list(db.cursor.fetchall())
+    def get_zone_levels(self):
+        """
+        Zone levels the result depends on, used to version cached results. Empty means depending on any filler run.
+        """
+        return ()
+
+    def get_result(self, db=None, cache=None, pooled=False, **kwargs):
+        if pooled:
+            with self.checkout(db=db) as task_db:
+                return self.get_result(db=task_db, cache=cache, **kwargs)
+        if cache is None or not self.cacheable or kwargs.get("raw_data", False):
+            return Getter.get_result(self, db=db, **kwargs)
+        else:
+            return cache.get_result(getter=self, db=db, **kwargs)
+
+    @contextlib.contextmanager
+    def checkout(self, db=None):
+        """
+        Context manager yielding a pooled copy of db (or of the database of the getter), restoring the database of the getter afterwards
+        """
+        if db is None:
+            db = self.db
+        if db is None:
+            raise ValueError("please set a database to query from")
+        previous_db = self.db
+        try:
+            with db.checkout() as task_db:
+                yield task_db
+        finally:
+            self.db = previous_db
+
+    def write_cached_result(self, result, path):
+        result.to_parquet(path)
+
+    def read_cached_result(self, path):
+        return gpd.read_parquet(path)
+
+    def get(self, db, raw_data=False, chunk_size=10**4, **kwargs):
+        chunks = list(self.iter_get(db=db, raw_data=raw_data, chunk_size=chunk_size))
         if raw_data:
-            return self.parse_results(query_result=query_result)
+            return [elt for chunk in chunks for elt in chunk]
+        elif len(chunks) == 0:
+            return self.build_gdf(self.parse_columns(query_result=[]))
+        elif len(chunks) == 1:
+            return chunks[0]
         else:
-            gdf = gpd.GeoDataFrame(
-                self.parse_results(query_result=query_result),
-                crs="epsg:4326",
-                columns=self.columns,
-            )
-            return gdf
+            return pd.concat(chunks, ignore_index=True)
+
+    def iter_result(
+        self, db=None, chunk_size=10**4, raw_data=False, pooled=False, **kwargs
+    ):
+        """
+        Generator equivalent of get_result, yielding GeoDataFrames (or lists of dicts if raw_data) of at most chunk_size rows
+        """
+        if pooled:
+            with self.checkout(db=db) as task_db:
+                yield from self.iter_result(
+                    db=task_db, chunk_size=chunk_size, raw_data=raw_data, **kwargs
+                )
+            return
+        if db is None:
+            db = self.db
+        if db is None:
+            raise ValueError("please set a database to query from")
+        self.db = db
+        self.prepare()
+        try:
+            yield from self.iter_get(db=db, chunk_size=chunk_size, raw_data=raw_data)
+        finally:
+            self.cleanup()
+
+    def iter_get(self, db, chunk_size=10**4, raw_data=False):
+        for query_result in self.iter_query_result(db=db, chunk_size=chunk_size):
+            if raw_data:
+                yield self.parse_results(query_result=query_result)
+            else:
+                yield self.build_gdf(self.parse_columns(query_result=query_result))
+
+    def iter_query_result(self, db, chunk_size=10**4):
+        """
+        Executes the query in a named (server-side) cursor, and yields the raw rows chunk by chunk.
+        The cursor is declared WITH HOLD, so that commits happening while iterating (e.g. caching geocoded addresses) do not close it.
+        """
+        cursor_name = "gisgetter_" + "".join(
+            random.choice(string.ascii_lowercase + string.digits) for _ in range(10)
+        )
+        cursor = db.connection.cursor(name=cursor_name, withhold=True)
+        cursor.itersize = chunk_size
+        try:
+            cursor.execute(self.query(), self.query_attributes())
+            while True:
+                query_result = cursor.fetchmany(chunk_size)
+                if not query_result:
+                    break
+                yield query_result
+        finally:
+            cursor.close()
+
+    def parse_columns(self, query_result):
+        """
+        returns dict of numpy arrays, one per column of the query result (see result_columns), with geometries decoded
+        """
+        if len(query_result):
+            arrays = [
+                np.fromiter(col, dtype=object, count=len(query_result))
+                for col in zip(*query_result)
+            ]
+        else:
+            arrays = [np.array([], dtype=object) for _ in self.result_columns]
+        ans = dict(zip(self.result_columns, arrays))
+        ans[self.geometry_column] = wkb_to_geoms(ans[self.geometry_column])
+        self.transform_columns(ans)
+        return ans
+
+    def transform_columns(self, col_dict):
+        """
+        Modifies col_dict in place, e.g. to derive columns or cast types. Nothing by default.
+        """
+        pass
+
+    def parse_results(self, query_result):
+        """
+        returns list of elements to be used for pandas or geopandas
+        """
+        return self.build_records(self.parse_columns(query_result=query_result))
+
+    def build_records(self, col_dict):
+        return [
+            dict(zip(self.columns, vals))
+            for vals in zip(*(col_dict[c] for c in self.columns))
+        ]
+
+    def build_gdf(self, col_dict):
+        gdf = gpd.GeoDataFrame(
+            {c: col_dict[c] for c in self.columns},
+            geometry=self.geometry_column,
+            crs="epsg:4326",
+            columns=self.columns,
+        )
+        return gdf.infer_objects()
 
 
 class LocationPointsGetter(GISGetter):
     """
     Mother class for specific location type queries
+
+    With add_noise, points are moved by a random offset: uniform in [-noise_size,noise_size] for both coordinates if noise_unit is "degrees",
+    uniform in a disc of radius noise_size if noise_unit is "meters" (local equirectangular approximation).
+    Random draws come from a numpy Generator, seeded by seed.
+
+    Locations are deduplicated client-side and sent as array parameters (unnest(...) WITH ORDINALITY AS tl(...,id)),
+    in queries without DDL; rows are returned once per distinct location and expanded back to the input order.
+    One query is run per chunk of chunk_size input locations, with the distinct locations of the chunk only, so that the first chunk
+    is yielded without resolving the whole list first (a location repeated in several chunks is queried once per chunk).
+    With use_temp_table, locations are inserted in a temporary table instead (one row per input).
+    Queries read locations from locations_table(), ordered by tl.id.
+    If restore_input_locations, the location column of the result is set back to the input locations (when queries return keys derived from them).
     """
 
     columns = ("location", "geometry", "lat", "long")
+    cacheable = False  # results depend on location_list, and can be random
+    restore_input_locations = False
+    earth_radius = 6371008.8  # meters, mean radius
 
     def __init__(
         self,
         location_list,
         add_noise=False,
         noise_size=0.01,
+        noise_unit="degrees",
+        seed=None,
+        use_temp_table=False,
         extra_loc_transform=lambda x: x,
         **kwargs,
     ):
         self.location_list = [extra_loc_transform(l) for l in location_list]
+        self.use_temp_table = use_temp_table
         self.add_noise = add_noise
         self.noise_size = noise_size
+        if noise_unit not in ("degrees", "meters"):
+            raise ValueError(f"Unrecognized noise_unit:{noise_unit}")
+        self.noise_unit = noise_unit
+        self.rng = np.random.default_rng(seed)
         Getter.__init__(self, **kwargs)
         self.rnd_str = "".join(
             random.choice(string.ascii_letters + string.digits) for _ in range(10)
         )
         self.transform_location()
+        self.dedup_locations()
 
     def transform_location(self):
         pass
 
-    def get(self, **kwargs):
-        gdf = GISGetter.get(self, **kwargs)
-        if self.add_noise:
-            tmp = []
-            for index, poi in gdf.iterrows():
-                geom = gdf.loc[index, "geometry"]
-                if geom is None:
-                    new_point = None
-                else:
-                    new_point = translate(
-                        geom,
-                        xoff=(random.random() - 0.5) * 2 * self.noise_size,
-                        yoff=(random.random() - 0.5) * 2 * self.noise_size,
+    def dedup_locations(self):
+        """
+        Sets unique_locations (in order of first appearance) and locations_inverse (index in unique_locations of each location)
+        """
+        index = dict()
+        self.locations_inverse = np.fromiter(
+            (index.setdefault(l, len(index)) for l in self.location_list),
+            dtype=np.int64,
+            count=len(self.location_list),
+        )
+        self.unique_locations = list(index.keys())
+
+    def locations_table(self):
+        if self.use_temp_table:
+            return f"temp_locations_{self.rnd_str} tl"
+        else:
+            return "unnest(%(locations)s::text[]) WITH ORDINALITY AS tl(location,id)"
+
+    def result_index(self):
+        """
+        Index of the row of the query result for each location of location_list (array parameters path)
+        """
+        return self.locations_inverse
+
+    def iter_get(self, db, chunk_size=10**4, raw_data=False):
+        if self.use_temp_table:
+            yield from GISGetter.iter_get(
+                self, db=db, chunk_size=chunk_size, raw_data=raw_data
+            )
+            return
+        unique_locations = self.unique_locations
+        locations_inverse = self.locations_inverse
+        try:
+            for start in range(0, len(self.location_list), chunk_size):
+                # query, result_index and query_attributes see the distinct locations of the chunk only
+                chunk_unique, self.locations_inverse = np.unique(
+                    locations_inverse[start : start + chunk_size], return_inverse=True
+                )
+                self.unique_locations = [unique_locations[i] for i in chunk_unique]
+                col_dicts = [
+                    self.parse_columns(query_result=query_result)
+                    for query_result in self.iter_query_result(
+                        db=db, chunk_size=chunk_size
                     )
-                tmp.append(
-                    {
-                        "geometry": new_point,
+                ]
+                if len(col_dicts) == 0:
+                    unique_cols = self.parse_columns(query_result=[])
+                else:
+                    unique_cols = {
+                        c: np.concatenate([cd[c] for cd in col_dicts])
+                        for c in col_dicts[0]
                     }
-                )
-            new_gdf = gpd.GeoDataFrame(tmp, columns=["geometry"])
-            gdf["geometry"] = new_gdf["geometry"]
-            gdf["lat"] = gdf["geometry"].y
-            gdf["long"] = gdf["geometry"].x
+                index = self.result_index()
+                col_dict = {c: v[index] for c, v in unique_cols.items()}
+                if self.restore_input_locations:
+                    col_dict["location"] = np.fromiter(
+                        self.location_list[start : start + chunk_size],
+                        dtype=object,
+                        count=len(index),
+                    )
+                if raw_data:
+                    yield self.build_records(col_dict)
+                else:
+                    yield self.build_gdf(col_dict)
+        finally:
+            self.unique_locations = unique_locations
+            self.locations_inverse = locations_inverse
+
+    def build_gdf(self, col_dict):
+        if self.add_noise:
+            self.apply_noise(col_dict)
+        return GISGetter.build_gdf(self, col_dict)
 
-        return gdf
+    def apply_noise(self, col_dict):
+        """
+        Moves the points of col_dict in place, updating lat and long accordingly
+        """
+        geoms = col_dict["geometry"]
+        long = shapely.get_x(geoms)
+        lat = shapely.get_y(geoms)
+        if self.noise_unit == "degrees":
+            dlong, dlat = (self.rng.random((2, len(geoms))) - 0.5) * 2 * self.noise_size
+        else:
+            radius = self.noise_size * np.sqrt(self.rng.random(len(geoms)))
+            angle = 2 * np.pi * self.rng.random(len(geoms))
+            dlat = np.degrees(radius * np.sin(angle) / self.earth_radius)
+            dlong = np.degrees(
+                radius * np.cos(angle) / (self.earth_radius * np.cos(np.radians(lat)))
+            )
+        long = long + dlong
+        lat = lat + dlat
+        new_geoms = shapely.points(long, lat)
+        new_geoms[np.isnan(long)] = None
+        col_dict["geometry"] = new_geoms
+        col_dict["lat"] = lat
+        col_dict["long"] = long
 
     def prepare(self):
         Getter.prepare(self)
+        if not self.use_temp_table:
+            return
         self.db.cursor.execute(
             f"""
             CREATE TEMP TABLE IF NOT EXISTS temp_locations_{self.rnd_str}(
@@ -123,15 +439,14 @@ class LocationPointsGetter(GISGetter):
         raise NotImplementedError
 
     def query_attributes(self):
-        return dict()
-
-    def parse_results(self, query_result):
-        """
-        returns list of elements to be used for pandas or geopandas
-        """
-        raise NotImplementedError
+        if self.use_temp_table:
+            return dict()
+        else:
+            return dict(locations=self.unique_locations)
 
     def cleanup(self):
+        if not self.use_temp_table:
+            return
         self.db.cursor.execute(
             f"""
             DROP TABLE IF EXISTS temp_locations_{self.rnd_str};
@@ -142,9 +457,22 @@ class LocationPointsGetter(GISGetter):
 class AreaPointsGetter(LocationPointsGetter):
     """
     Returns coordinates of points from a list of areas by code and zone level
+    Points are sampled once per distinct area of each chunk (as many as the area is requested in the chunk) and scattered back in input order
+
+    With use_sampling_index, points are drawn client-side from the triangulation of the zones (see sampling.SamplingIndex), without rejection sampling.
+    The index is built once per zone level and data version, and persisted in sampling_cache_folder (by default in the data folder of the database).
     """
 
-    def __init__(self, zone_level="bezirk", location_ref_type="code", **kwargs):
+    result_columns = ("location", "lat", "long", "geometry")
+
+    def __init__(
+        self,
+        zone_level="bezirk",
+        location_ref_type="code",
+        use_sampling_index=False,
+        sampling_cache_folder=None,
+        **kwargs,
+    ):
         self.zone_level = zone_level
         if location_ref_type not in (
             "code",
@@ -153,60 +481,147 @@ class AreaPointsGetter(LocationPointsGetter):
         ):
             raise ValueError(f"Unrecognized ref_type for location:{location_ref_type}")
         self.location_ref_type = location_ref_type
+        self.use_sampling_index = use_sampling_index
+        self.sampling_cache_folder = sampling_cache_folder
         LocationPointsGetter.__init__(self, **kwargs)
 
+    def prepare(self):
+        if self.use_sampling_index:
+            Getter.prepare(self)
+        else:
+            LocationPointsGetter.prepare(self)
+
+    def cleanup(self):
+        if not self.use_sampling_index:
+            LocationPointsGetter.cleanup(self)
+
+    def iter_get(self, db, chunk_size=10**4, raw_data=False):
+        if not self.use_sampling_index:
+            yield from LocationPointsGetter.iter_get(
+                self, db=db, chunk_size=chunk_size, raw_data=raw_data
+            )
+            return
+        from .sampling import get_sampling_index
+
+        index = get_sampling_index(
+            db=db,
+            zone_level=self.zone_level,
+            gis_type=self.query_attributes()["gis_type"],
+            location_ref_type=self.location_ref_type,
+            cache_folder=self.sampling_cache_folder,
+        )
+        for start in range(0, len(self.location_list), chunk_size):
+            col_dict = index.sample_columns(
+                self.location_list[start : start + chunk_size], rng=self.rng
+            )
+            self.transform_columns(col_dict)
+            if raw_data:
+                yield self.build_records(col_dict)
+            else:
+                yield self.build_gdf(col_dict)
+
     def query_attributes(self):
-        return dict(zone_level=self.zone_level, gis_type="zaehlsprengel")
+        ans = LocationPointsGetter.query_attributes(self)
+        if not self.use_temp_table:
+            ans["counts"] = np.bincount(
+                self.locations_inverse, minlength=len(self.unique_locations)
+            ).tolist()
+        ans.update(zone_level=self.zone_level, gis_type="zaehlsprengel")
+        return ans
+
+    def result_index(self):
+        """
+        Rows are returned by distinct location then rank: the k-th occurrence of a location gets the k-th point sampled for it
+        """
+        counts = np.bincount(
+            self.locations_inverse, minlength=len(self.unique_locations)
+        )
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        order = np.argsort(self.locations_inverse, kind="stable")
+        ranks = np.empty(len(order), dtype=np.int64)
+        ranks[order] = np.arange(len(order)) - np.repeat(offsets, counts)
+        return offsets[self.locations_inverse] + ranks
+
+    def ranked_locations_query(self):
+        if self.use_temp_table:
+            return f"""ranked_locations AS (SELECT
+            tl.id,
+            tl.location,
+            ROW_NUMBER() OVER (PARTITION BY tl.location ORDER BY tl.id) AS rk
+        FROM {self.locations_table()}),
+        location_counts AS (SELECT location,COUNT(*) AS nb_points
+        FROM ranked_locations
+        GROUP BY location)"""
+        else:
+            return """location_counts AS (SELECT location,nb_points,id
+        FROM unnest(%(locations)s::text[],%(counts)s::int[]) WITH ORDINALITY AS tl(location,nb_points,id)),
+        ranked_locations AS (SELECT
+            lc.id,
+            lc.location,
+            rk
+        FROM location_counts lc
+        CROSS JOIN LATERAL generate_series(1,lc.nb_points) AS rk)"""
 
     def query(self):
         return f"""
-        WITH main_query AS(SELECT
-            tl.location,
-            CASE ST_NumGeometries(gd.geom)
-                WHEN 0 THEN NULL
-                WHEN 1 THEN ST_AsText(ST_GeometryN(ST_GeneratePoints(gd.geom,1),1))
-                ELSE ST_AsText(ST_GeometryN(ST_GeneratePoints(gd.geom,100),(random()*100)::int+1))
-            END AS geom
-        FROM temp_locations_{self.rnd_str} tl
-        LEFT OUTER JOIN zone_levels zl
+        WITH {self.ranked_locations_query()},
+        sampled_points AS (SELECT
+            lc.location,
+            d.path[1] AS rk,
+            d.geom
+        FROM location_counts lc
+        INNER JOIN zone_levels zl
                 ON zl.name=%(zone_level)s
-        LEFT OUTER JOIN zones z
-                ON zl.id=z.level
-                AND COALESCE(z.{self.location_ref_type}::text,z.id::text)=tl.location
-        LEFT OUTER JOIN gis_types gt
+        CROSS JOIN LATERAL (SELECT z.id
+                FROM zones z
+                WHERE zl.id=z.level
+                AND COALESCE(z.{self.location_ref_type}::text,z.id::text)=lc.location
+                ORDER BY z.id
+                LIMIT 1) z
+        INNER JOIN gis_types gt
                 ON gt.name=%(gis_type)s
-        LEFT OUTER JOIN gis_data gd
+        INNER JOIN gis_data gd
                 ON gd.gis_type=gt.id
                 AND gd.zone_id=z.id
                 AND gd.zone_level=zl.id
-        ORDER BY tl.id)
-        SELECT location,ST_Y(geom) AS geo_lat,ST_X(geom) AS geo_long,geom FROM main_query;
+                AND NOT ST_IsEmpty(gd.geom)
+        CROSS JOIN LATERAL ST_Dump(ST_GeneratePoints(gd.geom,lc.nb_points::int)) d)
+        SELECT
+            rl.location,
+            ST_Y(sp.geom) AS geo_lat,
+            ST_X(sp.geom) AS geo_long,
+            ST_AsBinary(sp.geom) AS geometry
+        FROM ranked_locations rl
+        LEFT OUTER JOIN sampled_points sp
+                ON sp.location=rl.location
+                AND sp.rk=rl.rk
+        ORDER BY rl.id,rl.rk;
         """
 
-    def parse_results(self, query_result):
-        return [
-            {
-                "location": loc,
-                "lat": geo_lat,
-                "long": geo_long,
-                "geometry": shapely.wkt.loads(geo),
-            }
-            for (
-                loc,
-                geo_lat,
-                geo_long,
-                geo,
-            ) in query_result
-        ]
-
 
 class AddressPointsGetter(LocationPointsGetter):
     """
     Returns coordinates of points from a list of addresses
     Using a nominatim instance
+
+    Uncached addresses are geocoded concurrently (geocoding_workers parallel requests, at most geocoding_rate_limit requests per second if set).
+    A circuit breaker shared by all getters using the same Nominatim instance stops querying it when it keeps failing,
+    and its last known state is reused as health check for health_ttl seconds.
+    Geocoder errors are raised unless skippable, in which case the addresses concerned are left unresolved.
+
+    Addresses go through an in-process LRU cache shared by getters on the same database (geocoding.AddressCache), skipping the database for repeated lookups.
+    Geocoded addresses are written behind to cached_addresses in bulk, when cache_flush_size addresses are pending or the last write is older than cache_flush_interval seconds,
+    and at cleanup if flush_on_cleanup.
+    Addresses not found by the geocoder are cached as such (status not_found) and not geocoded again for negative_cache_ttl seconds.
+
+    The cache is keyed by addresses normalized by normalizer (geocoding.AddressNormalizer by default), falling back on the raw address for entries cached before normalization.
+    Addresses are deduplicated on their normalized form, the first raw form being sent to the geocoder. Cache hit rates are logged and kept in cache_stats.
+    Not available with use_temp_table.
     """
 
     columns = ("location", "lat", "long", "geometry")
+    result_columns = ("location", "lat", "long", "geometry", "known_failure")
+    restore_input_locations = True
 
     def __init__(
         self,
@@ -215,6 +630,14 @@ class AddressPointsGetter(LocationPointsGetter):
         nominatim_user_agent="gis_fillers",
         skippable=False,
         unsafe_nominatim=False,
+        geocoding_workers=4,
+        geocoding_rate_limit=None,
+        health_ttl=60.0,
+        cache_flush_size=1000,
+        cache_flush_interval=10.0,
+        flush_on_cleanup=True,
+        negative_cache_ttl=7 * 24 * 3600,
+        normalizer=None,
         **kwargs,
     ):
         self.nominatim_host = nominatim_host
@@ -222,11 +645,26 @@ class AddressPointsGetter(LocationPointsGetter):
         self.skippable = skippable
         self.unsafe_nominatim = unsafe_nominatim  # You do not want to run queries to the public Nominatim instance for sensitive data
         self.nominatim_user_agent = nominatim_user_agent
+        self.geocoding_workers = geocoding_workers
+        self.geocoding_rate_limit = geocoding_rate_limit
+        self.health_ttl = health_ttl
+        self.cache_flush_size = cache_flush_size
+        self.cache_flush_interval = cache_flush_interval
+        self.flush_on_cleanup = flush_on_cleanup
+        self.negative_cache_ttl = negative_cache_ttl
+        if normalizer is None:
+            self.normalizer = geocoding.AddressNormalizer()
+        else:
+            self.normalizer = normalizer
+        self.query_locations = None
         AreaPointsGetter.__init__(self, **kwargs)
+        if self.use_temp_table:
+            raise ValueError("use_temp_table is not available for AddressPointsGetter")
         self.set_geolocator()
 
     def set_geolocator(self):
         if self.nominatim_host is None:
+            self.circuit_breaker = geocoding.get_circuit_breaker("nominatim_public")
             if self.unsafe_nominatim:
                 self.geolocator = Nominatim(user_agent=self.nominatim_user_agent)
             elif self.skippable:
@@ -237,6 +675,9 @@ class AddressPointsGetter(LocationPointsGetter):
                     "Provide a specific Nominatim host. This error prevents you from using the public one by default, as it can expose sensitive data"
                 )
         else:
+            self.circuit_breaker = geocoding.get_circuit_breaker(
+                f"{self.nominatim_host}:{self.nominatim_port}"
+            )
             self.geolocator = Nominatim(
                 user_agent=self.nominatim_user_agent,
                 domain=f"{self.nominatim_host}:{self.nominatim_port}",
@@ -249,12 +690,26 @@ class AddressPointsGetter(LocationPointsGetter):
 
                 self.geolocator = blank_fn
                 self.geolocator.geocode = blank_fn
+                # not reporting successes of the blank geolocator to the shared state
+                self.circuit_breaker = geocoding.CircuitBreaker()
+        if hasattr(self, "geolocator"):
+            self.geocoding_pool = geocoding.GeocodingPool(
+                geolocator=self.geolocator,
+                max_workers=self.geocoding_workers,
+                rate_limit=self.geocoding_rate_limit,
+                circuit_breaker=self.circuit_breaker,
+                raise_errors=not self.skippable,
+                logger=self.logger,
+            )
 
     def test_geolocator(self):
-        try:
-            self.geolocator.geocode("Vienna")
+        if geocoding.check_geocoder(
+            geolocator=self.geolocator,
+            circuit_breaker=self.circuit_breaker,
+            health_ttl=self.health_ttl,
+        ):
             return True
-        except geopy.exc.GeocoderUnavailable:
+        else:
             self.logger.info("Geocoder not available, skipping the queries")
             return False
 
@@ -265,67 +720,185 @@ class AddressPointsGetter(LocationPointsGetter):
                 for l in self.location_list
             ]
 
+    def dedup_locations(self):
+        """
+        unique_locations are normalized addresses, raw_locations gives the first raw address for each of them
+        """
+        index = dict()
+        self.raw_locations = dict()
+        normalized = dict()
+        for l in self.location_list:
+            if l not in normalized:
+                normalized[l] = self.normalizer(l)
+            if normalized[l] not in index:
+                index[normalized[l]] = len(index)
+                self.raw_locations[normalized[l]] = l
+        self.locations_inverse = np.fromiter(
+            (index[normalized[l]] for l in self.location_list),
+            dtype=np.int64,
+            count=len(self.location_list),
+        )
+        self.unique_locations = list(index.keys())
+
+    def locations_table(self):
+        return "unnest(%(locations)s::text[],%(raw_locations)s::text[]) WITH ORDINALITY AS tl(location,raw_location,id)"
+
     def query(self):
         return f"""
         SELECT tl.location,
                 ST_Y(ca.geom) AS geo_lat,
                 ST_X(ca.geom) AS geo_long,
-                ST_AsText(ca.geom) AS geometry
-        FROM temp_locations_{self.rnd_str} tl
-        LEFT OUTER JOIN cached_addresses ca
-        ON ca.address=tl.location
+                ST_AsBinary(ca.geom) AS geometry,
+                COALESCE(ca.status='not_found'
+                    AND ca.updated_at>=CURRENT_TIMESTAMP-make_interval(secs=>%(negative_cache_ttl)s),
+                    false) AS known_failure
+        FROM {self.locations_table()}
+        LEFT OUTER JOIN LATERAL (SELECT ca.geom,ca.status,ca.updated_at
+                FROM cached_addresses ca
+                WHERE ca.address IN (tl.location,tl.raw_location)
+                ORDER BY ca.address=tl.location DESC
+                LIMIT 1) ca
+        ON true
         ORDER BY tl.id
         ;
         """
 
-    def parse_results(self, query_result):
-        ans = [
-            {
-                "location": loc,
-                "lat": geo_lat,
-                "long": geo_long,
-                "geometry": shapely.wkt.loads(geo),
-            }
-            for (
-                loc,
-                geo_lat,
-                geo_long,
-                geo,
-            ) in query_result
+    def prepare(self):
+        LocationPointsGetter.prepare(self)
+        self.address_cache = geocoding.get_address_cache(self.db)
+        self.cache_stats = dict(
+            inputs=len(self.location_list),
+            unique=len(self.unique_locations),
+            front_cache_hits=0,
+            db_hits=0,
+            negative_hits=0,
+            misses=0,
+        )
+
+    def query_attributes(self):
+        if self.query_locations is None:
+            locations = self.unique_locations
+        else:
+            locations = self.query_locations
+        return dict(
+            locations=locations,
+            raw_locations=[self.raw_locations[l] for l in locations],
+            negative_cache_ttl=self.negative_cache_ttl,
+        )
+
+    def iter_query_result(self, db, chunk_size=10**4):
+        """
+        Addresses in the front cache are not queried, their rows are built directly
+        """
+        front_cached = self.address_cache.lookup(self.unique_locations)
+        self.cache_stats["front_cache_hits"] += len(front_cached)
+        self.query_locations = [
+            l for l in self.unique_locations if l not in front_cached
         ]
-        to_resolve = [a for a in ans if a["geometry"] is None]
-        if len(to_resolve):
+        try:
+            db_rows = dict()
+            if len(self.query_locations):
+                for query_result in GISGetter.iter_query_result(
+                    self, db=db, chunk_size=chunk_size
+                ):
+                    db_rows.update((row[0], row) for row in query_result)
+        finally:
+            self.query_locations = None
+        for row in db_rows.values():
+            if row[3] is not None:
+                self.cache_stats["db_hits"] += 1
+            elif row[4]:
+                self.cache_stats["negative_hits"] += 1
+        rows = []
+        for l in self.unique_locations:
+            if l in front_cached:
+                lat, long = front_cached[l]
+                rows.append((l, lat, long, shapely.Point(long, lat).wkb, False))
+            else:
+                rows.append(db_rows[l])
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start : start + chunk_size]
+
+    def transform_columns(self, col_dict):
+        missing = shapely.is_missing(col_dict["geometry"])
+        for i in np.flatnonzero(~missing):
+            self.address_cache.remember(
+                address=col_dict["location"][i],
+                geo_lat=col_dict["lat"][i],
+                geo_long=col_dict["long"][i],
+            )
+        known_failure = col_dict["known_failure"].astype(bool)
+        to_resolve = np.flatnonzero(missing & ~known_failure)
+        if len(to_resolve) or known_failure.any():
             self.logger.info(
-                f"Resolving {len(set([r['location'] for r in to_resolve]))} addresses out of {len(ans)}."
+                f"Resolving {len(to_resolve)} addresses out of {len(col_dict['location'])}, skipping {known_failure.sum()} known failures."
             )
-        temp_resolved = dict()
-        for a in to_resolve:
-            loc = a["location"]
-            if loc in temp_resolved.keys():
-                geoloc = temp_resolved[loc]
-            else:
-                geoloc = self.geolocator.geocode(loc)
-                temp_resolved[loc] = geoloc
-            if geoloc is not None:
-                a["geometry"] = shapely.wkt.loads(
-                    f"POINT({geoloc.longitude} {geoloc.latitude})"
+        # addresses geocoded by other getters, possibly not written yet
+        temp_resolved = self.address_cache.lookup(col_dict["location"][to_resolve])
+        self.cache_stats["front_cache_hits"] += len(temp_resolved)
+        to_geocode = {
+            self.raw_locations[l]: l
+            for l in col_dict["location"][to_resolve]
+            if l not in temp_resolved
+        }
+        self.cache_stats["misses"] += len(to_geocode)
+        geocoded = self.geocoding_pool.geocode(list(to_geocode.keys()))
+        for raw_loc, geoloc in geocoded.items():
+            loc = to_geocode[raw_loc]
+            if geoloc is None:
+                self.fill_cached_address(
+                    address=loc, geo_lat=None, geo_long=None, raw_address=raw_loc
                 )
-                a["lat"], a["long"] = geoloc.latitude, geoloc.longitude
+            else:
                 self.fill_cached_address(
-                    address=loc, geo_lat=a["lat"], geo_long=a["long"]
+                    address=loc,
+                    geo_lat=geoloc.latitude,
+                    geo_long=geoloc.longitude,
+                    raw_address=raw_loc,
                 )
-        return ans
+                temp_resolved[loc] = (geoloc.latitude, geoloc.longitude)
+        resolved = []
+        for i in to_resolve:
+            latlong = temp_resolved.get(col_dict["location"][i])
+            if latlong is not None:
+                col_dict["lat"][i], col_dict["long"][i] = latlong
+                resolved.append(i)
+        col_dict["geometry"][resolved] = shapely.points(
+            col_dict["long"][resolved].astype(float),
+            col_dict["lat"][resolved].astype(float),
+        )
+        if self.address_cache.needs_flush(
+            flush_size=self.cache_flush_size, flush_interval=self.cache_flush_interval
+        ):
+            self.address_cache.flush(self.db)
 
-    def fill_cached_address(self, address, geo_lat, geo_long):
-        self.db.cursor.execute(
-            """
-            INSERT INTO cached_addresses(address,geom)
-                SELECT %(address)s,ST_SetSRID(ST_MakePoint(%(geo_long)s::double precision,%(geo_lat)s::double precision),4326)
-                On CONFLICT DO NOTHING;
-            """,
-            dict(address=address, geo_lat=geo_lat, geo_long=geo_long),
+    def fill_cached_address(self, address, geo_lat, geo_long, raw_address=None):
+        """
+        Adds the (normalized) address to the write-behind buffer of cached_addresses, see flush_cached_addresses. geo_lat and geo_long are None for addresses not found.
+        """
+        self.address_cache.add(
+            address=address,
+            geo_lat=geo_lat,
+            geo_long=geo_long,
+            raw_address=raw_address,
         )
-        self.db.connection.commit()
+
+    def flush_cached_addresses(self):
+        written = self.address_cache.flush(self.db)
+        if written:
+            self.logger.info(f"Cached {written} addresses")
+
+    def cleanup(self):
+        LocationPointsGetter.cleanup(self)
+        if self.flush_on_cleanup:
+            self.flush_cached_addresses()
+        stats = self.cache_stats
+        if stats["unique"]:
+            hits = stats["front_cache_hits"] + stats["db_hits"] + stats["negative_hits"]
+            self.logger.info(
+                f"Address cache: {stats['inputs']} addresses, {stats['unique']} after normalization, hit rate {hits/stats['unique']:.1%} "
+                f"(front cache: {stats['front_cache_hits']}, database: {stats['db_hits']}, known failures: {stats['negative_hits']}, misses: {stats['misses']})"
+            )
 
 
 class ZipPointsGetter(LocationPointsGetter):
@@ -334,6 +907,7 @@ class ZipPointsGetter(LocationPointsGetter):
     """
 
     columns = ("location", "country_code", "lat", "long", "geometry")
+    result_columns = ("location", "country_code", "lat", "long", "geometry")
 
     def __init__(
         self, country=None, country_format="alpha_2", country_language=None, **kwargs
@@ -352,54 +926,36 @@ class ZipPointsGetter(LocationPointsGetter):
                 else:
                     location_list.append(l)
             self.location_list = location_list
-        if self.country_format == "alpha_2":
-            self.location_list = [
-                (
-                    (ctry[:2] if isinstance(ctry, str) else ctry),
-                    loc,
-                )
-                for (ctry, loc) in self.location_list
-            ]
-        elif self.country_format == "name":
-            country_dict = get_countries_info(language=self.country_language)
-
-            def a2code(ct):
-                a = country_dict.get(ct, None)
-                if a is None:
-                    return
-                else:
-                    return a.alpha_2
-
-            self.location_list = [
-                (
-                    a2code(ctry),
-                    loc,
-                )
-                for (ctry, loc) in self.location_list
-            ]
-        elif self.country_format == "alpha_3":
+        a2code = get_country_converter(
+            country_format=self.country_format, language=self.country_language
+        )
+        # mapping distinct country values only
+        country_codes = {
+            ctry: a2code(ctry) for ctry in set(l[0] for l in self.location_list)
+        }
+        self.location_list = [
+            (country_codes[ctry], loc) for (ctry, loc) in self.location_list
+        ]
 
-            def a2code(ct):
-                a = pycountry.countries.get(alpha_3=ct)
-                if a is None:
-                    return
-                else:
-                    return a.alpha_2
+    def locations_table(self):
+        if self.use_temp_table:
+            return f"temp_locations_{self.rnd_str} tl"
+        else:
+            return "unnest(%(countries)s::text[],%(locations)s::text[]) WITH ORDINALITY AS tl(country_code,location,id)"
 
-            self.location_list = [
-                (
-                    a2code(ctry),
-                    loc,
-                )
-                for (ctry, loc) in self.location_list
-            ]
+    def query_attributes(self):
+        if self.use_temp_table:
+            return dict()
         else:
-            raise ValueError(
-                f"country_format: {self.country_format} unknown. Choose from (alpha_2,alpha_3,name)"
+            return dict(
+                countries=[country for country, loc in self.unique_locations],
+                locations=[loc for country, loc in self.unique_locations],
             )
 
     def prepare(self):
         Getter.prepare(self)
+        if not self.use_temp_table:
+            return
         self.rnd_str = "".join(
             random.choice(string.ascii_letters + string.digits) for _ in range(10)
         )
@@ -429,29 +985,11 @@ class ZipPointsGetter(LocationPointsGetter):
                 tl.country_code,
                 ST_Y(gz.geom) AS geo_lat,
                 ST_X(gz.geom) AS geo_long,
-                ST_AsText(gz.geom) AS geometry
-        FROM temp_locations_{self.rnd_str} tl
+                ST_AsBinary(gz.geom) AS geometry
+        FROM {self.locations_table()}
         LEFT OUTER JOIN geonames_zipcodes gz
         ON gz.country_code=tl.country_code
         AND gz.zip_code=tl.location
         ORDER BY tl.id
         ;
         """
-
-    def parse_results(self, query_result):
-        return [
-            {
-                "location": loc,
-                "country_code": c_code,
-                "lat": geo_lat,
-                "long": geo_long,
-                "geometry": shapely.wkt.loads(geo),
-            }
-            for (
-                loc,
-                c_code,
-                geo_lat,
-                geo_long,
-                geo,
-            ) in query_result
-        ]
@@ -0,0 +1,373 @@
+import re
+import time
+import logging
+import unicodedata
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2 import extras
+import geopy
+
+logger = logging.getLogger(__name__)
+
+# Errors of the geocoder service itself (not of the query): counted as failures by circuit breakers
+TRANSIENT_ERRORS = (
+    geopy.exc.GeocoderUnavailable,
+    geopy.exc.GeocoderTimedOut,
+    geopy.exc.GeocoderRateLimited,
+)
+
+
+class CircuitBreaker(object):
+    """
+    Stops sending requests to a geocoder after failure_threshold consecutive failures, for reset_timeout seconds.
+    After the timeout, a single request is let through: a success closes the circuit, a failure opens it again.
+
+    The outcome of the last request (available, checked_at) is kept, so that availability checks can be shared between getters (see check_geocoder).
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.available = None
+        self.checked_at = None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            elif time.monotonic() - self.opened_at >= self.reset_timeout:
+                # trial request, other requests are skipped until its outcome
+                self.opened_at = time.monotonic()
+                return True
+            else:
+                return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.available = True
+            self.checked_at = time.monotonic()
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.available = False
+            self.checked_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+_circuit_breakers = dict()
+_registry_lock = threading.Lock()
+
+
+def get_circuit_breaker(domain, **kwargs):
+    """
+    Returns the circuit breaker of a geocoder domain, shared in the process
+    """
+    with _registry_lock:
+        if domain not in _circuit_breakers:
+            _circuit_breakers[domain] = CircuitBreaker(**kwargs)
+        return _circuit_breakers[domain]
+
+
+def check_geocoder(geolocator, circuit_breaker, health_ttl=60.0, test_query="Vienna"):
+    """
+    Returns whether the geocoder is available, reusing the outcome of the last request to the geocoder if more recent than health_ttl seconds
+    """
+    if (
+        circuit_breaker.checked_at is not None
+        and time.monotonic() - circuit_breaker.checked_at < health_ttl
+    ):
+        return circuit_breaker.available
+    try:
+        geolocator.geocode(test_query)
+    except TRANSIENT_ERRORS:
+        circuit_breaker.record_failure()
+        return False
+    else:
+        circuit_breaker.record_success()
+        return True
+
+
+class RateLimiter(object):
+    """
+    Spaces calls to wait() by at least 1/rate seconds, across threads
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            scheduled = max(now, self.next_time)
+            self.next_time = scheduled + self.interval
+        if scheduled > now:
+            time.sleep(scheduled - now)
+
+
+class GeocodingPool(object):
+    """
+    Geocodes addresses with up to max_workers concurrent requests, at most rate_limit requests per second if set.
+    Requests go through circuit_breaker: when the geocoder keeps failing, remaining addresses are skipped instead of waiting for timeouts.
+
+    geocode returns a dict address: geopy Location (None if not found); failed or skipped addresses are left out.
+    failed and skipped count failed and skipped requests over the lifetime of the pool, which can be shared by threads.
+    With raise_errors, geocoder errors are raised instead (and GeocoderUnavailable while the circuit is open).
+    """
+
+    def __init__(
+        self,
+        geolocator,
+        max_workers=4,
+        rate_limit=None,
+        circuit_breaker=None,
+        raise_errors=False,
+        logger=logger,
+    ):
+        self.geolocator = geolocator
+        self.raise_errors = raise_errors
+        self.max_workers = max_workers
+        if rate_limit is None:
+            self.rate_limiter = None
+        else:
+            self.rate_limiter = RateLimiter(rate=rate_limit)
+        if circuit_breaker is None:
+            self.circuit_breaker = CircuitBreaker()
+        else:
+            self.circuit_breaker = circuit_breaker
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.failed = 0
+        self.skipped = 0
+
+    def geocode_one(self, address):
+        if not self.circuit_breaker.allow():
+            if self.raise_errors:
+                raise geopy.exc.GeocoderUnavailable(
+                    "Geocoder unavailable (circuit breaker open)"
+                )
+            return "skipped", None
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
+        try:
+            ans = self.geolocator.geocode(address)
+        except TRANSIENT_ERRORS as e:
+            self.circuit_breaker.record_failure()
+            self.logger.debug(f"Geocoding failed for {address}: {e}")
+            if self.raise_errors:
+                raise
+            return "failed", None
+        else:
+            self.circuit_breaker.record_success()
+            return "done", ans
+
+    def geocode(self, addresses):
+        addresses = list(dict.fromkeys(addresses))
+        if self.max_workers <= 1 or len(addresses) <= 1:
+            results = [self.geocode_one(a) for a in addresses]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(self.geocode_one, addresses))
+        failed = sum(status == "failed" for status, ans in results)
+        skipped = sum(status == "skipped" for status, ans in results)
+        with self.lock:
+            self.failed += failed
+            self.skipped += skipped
+        if failed or skipped:
+            self.logger.info(
+                f"Geocoding: {failed} failed and {skipped} skipped requests out of {len(addresses)}"
+            )
+        return {
+            a: ans for a, (status, ans) in zip(addresses, results) if status == "done"
+        }
+
+
+class AddressCache(object):
+    """
+    In-process front of the cached_addresses table.
+
+    Known addresses are kept in an LRU cache of front_cache_size entries, so that repeated lookups skip the database.
+    Newly geocoded addresses are added to the LRU cache and to a write-behind buffer, flushed in bulk (one multi-row INSERT, one commit)
+    by flush, e.g. when needs_flush says that enough addresses are pending or that the last flush is too old.
+    Addresses not found by the geocoder (added with geo_lat and geo_long None) are written with status not_found, and only kept in the database.
+    """
+
+    def __init__(self, front_cache_size=10**5):
+        self.front_cache_size = front_cache_size
+        self.lock = threading.Lock()
+        self.front_cache = OrderedDict()
+        self.pending = OrderedDict()
+        self.last_flush = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, addresses):
+        """
+        returns dict address: (lat, long) of the addresses in the front cache
+        """
+        ans = dict()
+        with self.lock:
+            for address in addresses:
+                if address in self.front_cache:
+                    self.front_cache.move_to_end(address)
+                    ans[address] = self.front_cache[address]
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return ans
+
+    def remember(self, address, geo_lat, geo_long):
+        with self.lock:
+            self.front_cache[address] = (geo_lat, geo_long)
+            self.front_cache.move_to_end(address)
+            while len(self.front_cache) > self.front_cache_size:
+                self.front_cache.popitem(last=False)
+
+    def add(self, address, geo_lat, geo_long, raw_address=None):
+        if geo_lat is not None:
+            self.remember(address=address, geo_lat=geo_lat, geo_long=geo_long)
+        with self.lock:
+            self.pending[address] = (geo_lat, geo_long, raw_address)
+
+    def needs_flush(self, flush_size=1000, flush_interval=10.0):
+        return len(self.pending) >= flush_size or (
+            len(self.pending) > 0
+            and time.monotonic() - self.last_flush >= flush_interval
+        )
+
+    def flush(self, db):
+        """
+        Writes pending addresses to cached_addresses in a single transaction, returns the number of addresses written.
+        Existing not_found entries are updated (new status and timestamp, one more attempt), resolved ones are kept.
+        """
+        with self.lock:
+            items = list(self.pending.items())
+            self.pending.clear()
+            self.last_flush = time.monotonic()
+        if not items:
+            return 0
+        try:
+            extras.execute_values(
+                db.cursor,
+                """
+                INSERT INTO cached_addresses(address,raw_address,geom,status,updated_at,attempts)
+                    SELECT v.address,
+                        v.raw_address,
+                        ST_SetSRID(ST_MakePoint(v.geo_long,v.geo_lat),4326),
+                        CASE WHEN v.geo_lat IS NULL THEN 'not_found' ELSE 'resolved' END,
+                        CURRENT_TIMESTAMP,
+                        1
+                    FROM (VALUES %s) AS v(address,geo_lat,geo_long,raw_address)
+                    ON CONFLICT (address) DO UPDATE
+                    SET geom=EXCLUDED.geom,
+                        status=EXCLUDED.status,
+                        updated_at=EXCLUDED.updated_at,
+                        attempts=cached_addresses.attempts+1
+                    WHERE cached_addresses.status<>'resolved';
+                """,
+                [(address, *val) for address, val in items],
+                template="(%s,%s::double precision,%s::double precision,%s)",
+                page_size=len(items),
+            )
+            db.connection.commit()
+        except Exception:
+            db.connection.rollback()
+            with self.lock:
+                for address, val in items:
+                    self.pending.setdefault(address, val)
+            raise
+        return len(items)
+
+
+_address_caches = dict()
+
+
+def get_address_cache(db, **kwargs):
+    """
+    Returns the AddressCache of a database, shared in the process
+    """
+    key = tuple(db.db_conninfo.get(k) for k in ("host", "port", "database", "options"))
+    with _registry_lock:
+        if key not in _address_caches:
+            _address_caches[key] = AddressCache(**kwargs)
+        return _address_caches[key]
+
+
+class AddressNormalizer(object):
+    """
+    Normalizes addresses to key the address cache, so that spelling variants of the same address share an entry:
+    Unicode NFC and casefolding, accents stripping (optional), abbreviations expansion, punctuation replaced by spaces, whitespace collapsed.
+    "Josefstädter Str. 39", "josefstadter str. 39" and "Josefstädter Straße 39" all become "josefstadter strasse 39".
+
+    abbreviations are matched on whole tokens, suffix_abbreviations on token endings (e.g. "hauptstr."), both after casefolding and accents stripping.
+    Any callable taking and returning a string can be used instead as normalizer of AddressPointsGetter.
+    """
+
+    default_abbreviations = {
+        "str.": "strasse",
+        "str": "strasse",
+        "g.": "gasse",
+        "pl.": "platz",
+    }
+    default_suffix_abbreviations = {
+        "str.": "strasse",
+    }
+
+    def __init__(
+        self,
+        abbreviations=None,
+        suffix_abbreviations=None,
+        strip_accents=True,
+        kept_characters="/",
+    ):
+        if abbreviations is None:
+            abbreviations = self.default_abbreviations
+        if suffix_abbreviations is None:
+            suffix_abbreviations = self.default_suffix_abbreviations
+        self.strip_accents = strip_accents
+        self.abbreviations = {
+            self.base_form(k, strip_accents=strip_accents): v
+            for k, v in abbreviations.items()
+        }
+        self.suffix_abbreviations = {
+            self.base_form(k, strip_accents=strip_accents): v
+            for k, v in suffix_abbreviations.items()
+        }
+        self.punctuation_re = re.compile(rf"[^\w{re.escape(kept_characters)}]+")
+
+    def base_form(self, text, strip_accents=True):
+        text = unicodedata.normalize("NFC", text).casefold()
+        if strip_accents:
+            text = "".join(
+                c
+                for c in unicodedata.normalize("NFKD", text)
+                if not unicodedata.combining(c)
+            )
+        return text
+
+    def expand(self, token):
+        if token in self.abbreviations:
+            return self.abbreviations[token]
+        for suffix, expansion in self.suffix_abbreviations.items():
+            if len(token) > len(suffix) and token.endswith(suffix):
+                return token[: -len(suffix)] + expansion
+        return token
+
+    def __call__(self, address):
+        text = self.base_form(address, strip_accents=self.strip_accents)
+        text = re.sub(r"[,;]", " ", text)
+        text = " ".join(self.expand(token) for token in text.split())
+        return " ".join(self.punctuation_re.sub(" ", text).split())
@@ -0,0 +1,319 @@
+import os
+import numpy as np
+import shapely
+
+from .generic_getters import GISGetter
+from .cache import GetterCache
+
+
+def triangulate(geoms):
+    """
+    Constrained Delaunay triangulation of an array of (multi)polygons.
+    Returns an array of triangles of shape (n,3,2) and, for each triangle, the index of the geometry it comes from.
+    Non polygonal parts (e.g. from repairing invalid geometries) are ignored.
+    Requires shapely>=2.1 (constrained_delaunay_triangles).
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    invalid = ~shapely.is_valid(geoms)
+    if invalid.any():
+        geoms = geoms.copy()
+        geoms[invalid] = shapely.make_valid(geoms[invalid])
+    parts, parts_index = shapely.get_parts(geoms, return_index=True)
+    if len(parts):
+        # collections from make_valid can hold multipolygons
+        parts, sub_index = shapely.get_parts(parts, return_index=True)
+        parts_index = parts_index[sub_index]
+    is_polygon = shapely.get_type_id(parts) == 3
+    parts = parts[is_polygon]
+    parts_index = parts_index[is_polygon]
+    triangles, triangles_index = shapely.get_parts(
+        shapely.constrained_delaunay_triangles(parts), return_index=True
+    )
+    coords = shapely.get_coordinates(triangles).reshape(-1, 4, 2)[:, :3]
+    return coords, parts_index[triangles_index]
+
+
+class SamplingIndex(object):
+    """
+    Area-weighted triangulation of zones, to draw uniform points in them without rejection sampling.
+
+    Triangles of all zones are stored in a single (n,3,2) array, grouped by zone (zone i owns triangles offsets[i] to offsets[i+1]).
+    cum_weights holds for each triangle i + the cumulative share of the zone area up to this triangle (in (0,1]), so that drawing a triangle for zone i is a binary search of i + U(0,1).
+    A point is then drawn in the triangle from two uniform variables (folded barycentric coordinates).
+    Coordinates are sampled uniformly in longitude/latitude, like ST_GeneratePoints on EPSG:4326 geometries.
+    """
+
+    def __init__(self, keys, offsets, triangles, cum_weights):
+        self.keys = np.asarray(keys, dtype=str)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.triangles = np.asarray(triangles, dtype=np.float64)
+        self.cum_weights = np.asarray(cum_weights, dtype=np.float64)
+        self.key_index = {k: i for i, k in enumerate(self.keys.tolist())}
+
+    @classmethod
+    def from_triangles(cls, triangles_keys, triangles):
+        """
+        Builds the index from triangles and the zone key of each triangle. Several geometries with the same key are sampled as one zone.
+        """
+        triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 2)
+        triangles_keys = np.asarray(triangles_keys, dtype=str)
+        ab = triangles[:, 1] - triangles[:, 0]
+        ac = triangles[:, 2] - triangles[:, 0]
+        areas = 0.5 * np.abs(ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0])
+        non_empty = areas > 0
+        triangles = triangles[non_empty]
+        areas = areas[non_empty]
+        keys, zone_index = np.unique(triangles_keys[non_empty], return_inverse=True)
+        order = np.argsort(zone_index, kind="stable")
+        triangles = triangles[order]
+        areas = areas[order]
+        zone_index = zone_index[order]
+        offsets = np.searchsorted(zone_index, np.arange(len(keys) + 1))
+
+        cum_areas = np.cumsum(areas)
+        zone_start = np.concatenate([[0.0], cum_areas])[offsets[:-1]]
+        zone_total = cum_areas[offsets[1:] - 1] - zone_start
+        cum_weights = zone_index + (cum_areas - zone_start[zone_index]) / (
+            zone_total[zone_index]
+        )
+        cum_weights[offsets[1:] - 1] = np.arange(1, len(keys) + 1)  # rounding
+        return cls(
+            keys=keys, offsets=offsets, triangles=triangles, cum_weights=cum_weights
+        )
+
+    @classmethod
+    def from_geometries(cls, keys, geoms):
+        triangles, geoms_index = triangulate(geoms)
+        return cls.from_triangles(
+            triangles_keys=np.asarray(keys, dtype=str)[geoms_index],
+            triangles=triangles,
+        )
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                keys=self.keys,
+                offsets=self.offsets,
+                triangles=self.triangles,
+                cum_weights=self.cum_weights,
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                keys=data["keys"],
+                offsets=data["offsets"],
+                triangles=data["triangles"],
+                cum_weights=data["cum_weights"],
+            )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def sample(self, locations, rng=None):
+        """
+        Draws one uniform point in the zone of each location.
+        Returns arrays of longitudes and latitudes, NaN for locations not in the index.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        zone_index = np.fromiter(
+            (self.key_index.get(str(l), -1) for l in locations),
+            dtype=np.int64,
+            count=len(locations),
+        )
+        found = zone_index >= 0
+        zi = zone_index[found]
+        tri = np.searchsorted(self.cum_weights, zi + rng.random(len(zi)), side="right")
+        tri = np.clip(tri, self.offsets[zi], self.offsets[zi + 1] - 1)
+        u, v = rng.random((2, len(zi)))
+        folded = u + v > 1
+        u[folded] = 1 - u[folded]
+        v[folded] = 1 - v[folded]
+        a = self.triangles[tri, 0]
+        points = (
+            a
+            + u[:, None] * (self.triangles[tri, 1] - a)
+            + v[:, None] * (self.triangles[tri, 2] - a)
+        )
+        long = np.full(len(locations), np.nan)
+        lat = np.full(len(locations), np.nan)
+        long[found] = points[:, 0]
+        lat[found] = points[:, 1]
+        return long, lat
+
+    def sample_columns(self, locations, rng=None):
+        """
+        Same as sample, formatted as GISGetter columns (location, lat, long, geometry)
+        """
+        long, lat = self.sample(locations, rng=rng)
+        geometry = shapely.points(long, lat)
+        geometry[np.isnan(long)] = None
+        lat_col = lat.astype(object)
+        long_col = long.astype(object)
+        lat_col[np.isnan(lat)] = None
+        long_col[np.isnan(long)] = None
+        return dict(
+            location=np.asarray(locations, dtype=object),
+            lat=lat_col,
+            long=long_col,
+            geometry=geometry,
+        )
+
+
+class SamplingIndexGetter(GISGetter):
+    """
+    Returns the SamplingIndex of the zones of a zone level for a gis_type, zones being keyed by location_ref_type (code, id or name).
+    Cached results are stored as npz files.
+    """
+
+    result_columns = ("location", "geometry")
+    cache_extension = "npz"
+
+    def __init__(
+        self,
+        zone_level="bezirk",
+        gis_type="zaehlsprengel",
+        location_ref_type="code",
+        **kwargs,
+    ):
+        self.zone_level = zone_level
+        self.gis_type = gis_type
+        if location_ref_type not in (
+            "code",
+            "id",
+            "name",
+        ):
+            raise ValueError(f"Unrecognized ref_type for location:{location_ref_type}")
+        self.location_ref_type = location_ref_type
+        GISGetter.__init__(self, **kwargs)
+
+    def get_zone_levels(self):
+        return (self.zone_level,)
+
+    def query_attributes(self):
+        return dict(zone_level=self.zone_level, gis_type=self.gis_type)
+
+    def query(self):
+        return f"""
+        SELECT COALESCE(z.{self.location_ref_type}::text,z.id::text) AS location,
+            ST_AsBinary(gd.geom) AS geometry
+        FROM zone_levels zl
+        INNER JOIN zones z
+                ON zl.id=z.level
+        INNER JOIN gis_types gt
+                ON gt.name=%(gis_type)s
+        INNER JOIN gis_data gd
+                ON gd.gis_type=gt.id
+                AND gd.zone_id=z.id
+                AND gd.zone_level=zl.id
+        WHERE zl.name=%(zone_level)s
+        ORDER BY z.id;
+        """
+
+    def get(self, db, chunk_size=10**3, **kwargs):
+        triangles = []
+        triangles_keys = []
+        for query_result in self.iter_query_result(db=db, chunk_size=chunk_size):
+            col_dict = self.parse_columns(query_result=query_result)
+            chunk_triangles, geoms_index = triangulate(col_dict["geometry"])
+            triangles.append(chunk_triangles)
+            triangles_keys.append(col_dict["location"].astype(str)[geoms_index])
+        if len(triangles):
+            return SamplingIndex.from_triangles(
+                triangles_keys=np.concatenate(triangles_keys),
+                triangles=np.concatenate(triangles),
+            )
+        else:
+            return SamplingIndex.from_triangles(
+                triangles_keys=[], triangles=np.zeros((0, 3, 2))
+            )
+
+    def write_cached_result(self, result, path):
+        result.save(path)
+
+    def read_cached_result(self, path):
+        return SamplingIndex.load(path)
+
+
+_sampling_indexes = dict()
+
+
+def get_sampling_index(
+    db,
+    zone_level="bezirk",
+    gis_type="zaehlsprengel",
+    location_ref_type="code",
+    cache_folder=None,
+):
+    """
+    Returns the SamplingIndex of a zone level, kept in memory for the process and persisted in cache_folder
+    (by default {data_folder}/sampling_indexes/{gis_type}).
+    Indexes are rebuilt when the data version of the zone level changes.
+    """
+    if cache_folder is None:
+        cache_folder = os.path.join(db.data_folder, "sampling_indexes", gis_type)
+    getter = SamplingIndexGetter(
+        zone_level=zone_level, gis_type=gis_type, location_ref_type=location_ref_type
+    )
+    cache = GetterCache(cache_folder=cache_folder)
+    key = cache.get_key(getter=getter, db=db)
+    index_id = (cache_folder, zone_level, gis_type, location_ref_type)
+    if index_id not in _sampling_indexes or _sampling_indexes[index_id][0] != key:
+        _sampling_indexes[index_id] = (key, getter.get_result(db=db, cache=cache))
+    return _sampling_indexes[index_id][1]
+
+
+class ZonePointsSampler(GISGetter):
+    """
+    Bulk sampler of uniform points in zones, using the SamplingIndex of the zone level.
+    points_per_zone is either a dict {location: number of points} or a number of points for each zone of the level.
+    Points are yielded zone after zone, in chunks of chunk_size rows.
+    """
+
+    columns = ("location", "lat", "long", "geometry")
+    cacheable = False
+
+    def __init__(
+        self,
+        points_per_zone,
+        zone_level="bezirk",
+        gis_type="zaehlsprengel",
+        location_ref_type="code",
+        cache_folder=None,
+        seed=None,
+        **kwargs,
+    ):
+        self.points_per_zone = points_per_zone
+        self.zone_level = zone_level
+        self.gis_type = gis_type
+        self.location_ref_type = location_ref_type
+        self.cache_folder = cache_folder
+        self.rng = np.random.default_rng(seed)
+        GISGetter.__init__(self, **kwargs)
+
+    def iter_get(self, db, chunk_size=10**4, raw_data=False):
+        index = get_sampling_index(
+            db=db,
+            zone_level=self.zone_level,
+            gis_type=self.gis_type,
+            location_ref_type=self.location_ref_type,
+            cache_folder=self.cache_folder,
+        )
+        if isinstance(self.points_per_zone, dict):
+            locations = np.array(list(self.points_per_zone.keys()), dtype=str)
+            counts = np.array(list(self.points_per_zone.values()), dtype=np.int64)
+        else:
+            locations = index.keys
+            counts = np.full(len(locations), self.points_per_zone, dtype=np.int64)
+        cum_counts = np.concatenate([[0], np.cumsum(counts)])
+        for start in range(0, cum_counts[-1], chunk_size):
+            end = min(start + chunk_size, cum_counts[-1])
+            zones = np.searchsorted(cum_counts, np.arange(start, end), side="right") - 1
+            col_dict = index.sample_columns(locations[zones], rng=self.rng)
+            if raw_data:
+                yield self.build_records(col_dict)
+            else:
+                yield self.build_gdf(col_dict)
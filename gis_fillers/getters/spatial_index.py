@@ -0,0 +1,189 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+import shapely
+
+from .zone_getters import ZoneLevelGetter
+
+
+class ZoneIndex(object):
+    """
+    In-memory spatial index of the zones of a zone level: a shapely STRtree over their (prepared) geometries.
+    query and contains answer bulk requests with vectorized predicates, without database round trips.
+    """
+
+    def __init__(self, zone_ids, codes, names, geoms):
+        self.zone_ids = np.asarray(zone_ids, dtype=object)
+        self.codes = np.asarray(codes, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        self.geoms = np.asarray(geoms, dtype=object)
+        shapely.prepare(self.geoms)
+        self.tree = shapely.STRtree(self.geoms)
+        # estimated memory footprint: coordinates (twice, for the prepared geometries) and a fixed overhead per geometry
+        self.nbytes = 2 * 16 * int(
+            shapely.get_num_coordinates(self.geoms).sum()
+        ) + 256 * len(self.geoms)
+
+    @classmethod
+    def from_db(cls, db, zone_level="bezirk", gis_type="zaehlsprengel"):
+        gdf = ZoneLevelGetter(
+            db=db,
+            zone_level=zone_level,
+            gis_type=gis_type,
+            attributes=(),
+            spatial_order=False,
+        ).get_result()
+        return cls(
+            zone_ids=gdf["ZoneID"].to_numpy(dtype=object),
+            codes=gdf["code"].to_numpy(dtype=object),
+            names=gdf["Zone"].to_numpy(dtype=object),
+            geoms=gdf.geometry.to_numpy(dtype=object),
+        )
+
+    def __len__(self):
+        return len(self.geoms)
+
+    def query(self, geoms, predicate="intersects"):
+        """
+        Returns pairs (index in geoms, index of zone) for which predicate(geom, zone geometry) holds, as a (2,n) array (see shapely.STRtree.query)
+        """
+        return self.tree.query(np.asarray(geoms, dtype=object), predicate=predicate)
+
+    def contains(self, long, lat):
+        """
+        Returns for each point the index of a zone containing it, boundary included (the first one if several), -1 if none
+        """
+        points = shapely.points(
+            np.asarray(long, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+        )
+        points_index, zones_index = self.tree.query(points, predicate="intersects")
+        ans = np.full(len(points), -1, dtype=np.int64)
+        found, first = np.unique(points_index, return_index=True)
+        ans[found] = zones_index[first]
+        return ans
+
+    def locate(self, long, lat):
+        """
+        Same as contains, as columns zone_id, code and name (None for points outside of all zones)
+        """
+        index = self.contains(long=long, lat=lat)
+        found = index >= 0
+        ans = dict()
+        for col, values in (
+            ("zone_id", self.zone_ids),
+            ("code", self.codes),
+            ("name", self.names),
+        ):
+            col_values = np.full(len(index), None, dtype=object)
+            col_values[found] = values[index[found]]
+            ans[col] = col_values
+        return ans
+
+
+class ZoneIndexManager(object):
+    """
+    Keeps ZoneIndex objects of several zone levels in memory, within memory_budget bytes (estimated, see ZoneIndex.nbytes):
+    least recently used indexes are evicted when loading a new one exceeds it (the last loaded index is always kept).
+    Indexes are rebuilt when the data version of their zone level changes, i.e. when a filler registers a modification of it.
+    Data versions are read from the database at most once every version_ttl seconds per database and zone level,
+    so that lookups do not cost a database round trip: call refresh to see a modification before that.
+    """
+
+    def __init__(self, memory_budget=512 * 2**20, version_ttl=10.0):
+        self.memory_budget = memory_budget
+        self.version_ttl = version_ttl
+        self.lock = threading.Lock()
+        self.indexes = OrderedDict()
+        self.versions = dict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.version_checks = 0
+
+    @property
+    def memory_usage(self):
+        return sum(index.nbytes for version, index in self.indexes.values())
+
+    def refresh(self):
+        """
+        Forgets the data versions read from the database, so that the next lookups check them again
+        """
+        with self.lock:
+            self.versions.clear()
+
+    def get_version(self, db, db_key, zone_level):
+        """
+        Data version of zone_level, read from the database if not checked in the last version_ttl seconds
+        """
+        now = time.monotonic()
+        with self.lock:
+            if (db_key, zone_level) in self.versions:
+                version, checked_at = self.versions[(db_key, zone_level)]
+                if now - checked_at < self.version_ttl:
+                    return version
+        version = db.get_data_version(zone_levels=(zone_level,))
+        with self.lock:
+            self.version_checks += 1
+            self.versions[(db_key, zone_level)] = (version, now)
+        return version
+
+    def get_index(self, db, zone_level="bezirk", gis_type="zaehlsprengel"):
+        db_key = tuple(
+            db.db_conninfo.get(k) for k in ("host", "port", "database", "options")
+        )
+        key = (db_key, zone_level, gis_type)
+        version = self.get_version(db=db, db_key=db_key, zone_level=zone_level)
+        with self.lock:
+            if key in self.indexes and self.indexes[key][0] == version:
+                self.indexes.move_to_end(key)
+                self.hits += 1
+                return self.indexes[key][1]
+            self.misses += 1
+        index = ZoneIndex.from_db(db=db, zone_level=zone_level, gis_type=gis_type)
+        with self.lock:
+            self.indexes[key] = (version, index)
+            self.indexes.move_to_end(key)
+            while len(self.indexes) > 1 and self.memory_usage > self.memory_budget:
+                self.indexes.popitem(last=False)
+                self.evictions += 1
+        return index
+
+    def query(
+        self,
+        db,
+        geoms,
+        zone_level="bezirk",
+        gis_type="zaehlsprengel",
+        predicate="intersects",
+    ):
+        return self.get_index(db=db, zone_level=zone_level, gis_type=gis_type).query(
+            geoms=geoms, predicate=predicate
+        )
+
+    def contains(self, db, long, lat, zone_level="bezirk", gis_type="zaehlsprengel"):
+        return self.get_index(db=db, zone_level=zone_level, gis_type=gis_type).contains(
+            long=long, lat=lat
+        )
+
+    def stats(self):
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            version_checks=self.version_checks,
+            memory_usage=self.memory_usage,
+            levels=[key[1] for key in self.indexes],
+        )
+
+
+_zone_index_manager = ZoneIndexManager()
+
+
+def get_zone_index(db, zone_level="bezirk", gis_type="zaehlsprengel"):
+    """
+    Returns the ZoneIndex of a zone level from the ZoneIndexManager shared in the process
+    """
+    return _zone_index_manager.get_index(
+        db=db, zone_level=zone_level, gis_type=gis_type
+    )
@@ -0,0 +1,119 @@
+import string
+
+from . import Getter
+from .zone_getters import zone_attributes_joins
+
+
+class MVTGetter(Getter):
+    """
+    Returns a Mapbox Vector Tile (bytes) for tile z/x/y of a zone level and gis_type.
+    Features have the zone id, code, name and selected zone attributes (latest numerical value) as properties.
+
+    Only zones intersecting the tile are read (GiST index on gis_data.geom), clipped to the tile before being reprojected and encoded by PostGIS (ST_AsMVTGeom, ST_AsMVT):
+    payload size and latency depend on the content of the tile, not on the size of the zone level.
+    Tiles can be stored in a GetterCache passed to get_result; cached tiles are invalidated by filler runs modifying the zone level.
+    Requires PostGIS >= 3.0 (ST_TileEnvelope); the envelope is buffered with ST_Expand rather than the margin argument of PostGIS 3.1.
+    """
+
+    cacheable = True
+    cache_extension = "mvt"
+
+    def __init__(
+        self,
+        z,
+        x,
+        y,
+        zone_level="bezirk",
+        gis_type="zaehlsprengel_simplified",
+        attributes=("zs_population",),
+        extent=4096,
+        buffer=64,
+        layer_name=None,
+        **kwargs,
+    ):
+        Getter.__init__(self, **kwargs)
+        self.z = z
+        self.x = x
+        self.y = y
+        self.zone_level = zone_level
+        self.gis_type = gis_type
+        self.attributes = tuple(attributes)
+        for attr in self.attributes:
+            for c in attr:
+                if c not in string.ascii_letters + string.digits + "_":
+                    raise ValueError(f"Unsafe attribute name: {attr}")
+        self.extent = extent
+        self.buffer = buffer
+        if layer_name is None:
+            self.layer_name = zone_level
+        else:
+            self.layer_name = layer_name
+
+    def get_zone_levels(self):
+        return (self.zone_level,)
+
+    def query_attributes(self):
+        ans = dict(
+            z=self.z,
+            x=self.x,
+            y=self.y,
+            zone_level=self.zone_level,
+            gis_type=self.gis_type,
+            extent=self.extent,
+            buffer=self.buffer,
+            margin=self.buffer / self.extent,
+            layer_name=self.layer_name,
+        )
+        for i, attr in enumerate(self.attributes):
+            ans[f"attribute_{i}"] = attr
+        return ans
+
+    def query(self):
+        attribute_columns = "".join(
+            f',za{i}.value AS "{attr}"' for i, attr in enumerate(self.attributes)
+        )
+        return f"""
+            WITH tile AS (SELECT ST_TileEnvelope(%(z)s,%(x)s,%(y)s) AS geom),
+            bounds AS (SELECT tile.geom,
+                    ST_Transform(ST_Expand(tile.geom,%(margin)s*(ST_XMax(tile.geom)-ST_XMin(tile.geom))),4326) AS geom_4326
+                FROM tile),
+            mvtgeom AS (SELECT ST_AsMVTGeom(
+                        ST_Transform(ST_ClipByBox2D(gd.geom,bounds.geom_4326::box2d),3857),
+                        bounds.geom::box2d,%(extent)s,%(buffer)s,true) AS geom,
+                    z.id AS zone_id,z.code,z.name{attribute_columns}
+                FROM bounds
+                INNER JOIN zone_levels zl
+                ON zl.name=%(zone_level)s
+                INNER JOIN gis_types gt
+                ON gt.name=%(gis_type)s
+                INNER JOIN gis_data gd
+                ON gd.zone_level=zl.id AND gd.gis_type=gt.id
+                AND gd.geom && bounds.geom_4326
+                INNER JOIN zones z
+                ON z.id=gd.zone_id AND z.level=gd.zone_level
+                {zone_attributes_joins(nb_attributes=len(self.attributes))})
+            SELECT ST_AsMVT(mvtgeom.*,%(layer_name)s,%(extent)s,'geom') FROM mvtgeom
+            WHERE geom IS NOT NULL
+        ;"""
+
+    def get(self, db, **kwargs):
+        db.cursor.execute(self.query(), self.query_attributes())
+        ans = db.cursor.fetchone()
+        if ans is None or ans[0] is None:
+            return b""
+        else:
+            return bytes(ans[0])
+
+    def get_result(self, db=None, cache=None, **kwargs):
+        if cache is None:
+            return Getter.get_result(self, db=db, **kwargs)
+        else:
+            return cache.get_result(getter=self, db=db, **kwargs)
+
+    def write_cached_result(self, result, path):
+        with open(path, "wb") as f:
+            f.write(result)
+
+    def read_cached_result(self, path):
+        with open(path, "rb") as f:
+            return f.read()
@@ -16,14 +16,21 @@ class PopulationGetter(GISGetter):
     """
 
     columns = ("Zone", "ZoneID", "population", "geometry", "area")
+    result_columns = ("ZoneID", "level", "population", "Zone", "geometry", "area")
 
     def __init__(
         self,
         zone_level="bezirk",
         zone_attribute="population",
         simplified=True,
+        bbox=None,
+        within_zone=None,
         **kwargs,
     ):
+        """
+        bbox: (xmin,ymin,xmax,ymax) in EPSG:4326, only zones intersecting it are returned (using the GiST index on gis_data.geom)
+        within_zone: (zone_level,code_or_id), only zones having this zone as parent (or being this zone) are returned
+        """
         GISGetter.__init__(self, **kwargs)
         self.zone_level = zone_level
         self.zone_attribute = zone_attribute
@@ -31,23 +38,57 @@ class PopulationGetter(GISGetter):
             self.target_gt = "zaehlsprengel_simplified"
         else:
             self.target_gt = "zaehlsprengel"
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError(f"bbox should be (xmin,ymin,xmax,ymax), got: {bbox}")
+        self.bbox = bbox
+        if within_zone is not None and len(within_zone) != 2:
+            raise ValueError(
+                f"within_zone should be (zone_level,code_or_id), got: {within_zone}"
+            )
+        self.within_zone = within_zone
+
+    def filters_query(self):
+        """
+        WHERE clause restricting the selected zones (aliases z and gd), following bbox and within_zone
+        """
+        filters = []
+        if self.bbox is not None:
+            filters.append(
+                """gd.geom && ST_MakeEnvelope(%(xmin)s,%(ymin)s,%(xmax)s,%(ymax)s,4326)
+                    AND ST_Intersects(gd.geom,ST_MakeEnvelope(%(xmin)s,%(ymin)s,%(xmax)s,%(ymax)s,4326))"""
+            )
+        if self.within_zone is not None:
+            filters.append(
+                """(EXISTS (SELECT 1 FROM zone_parents zp
+                        INNER JOIN zone_levels zlw
+                        ON zlw.name=%(within_level)s AND zlw.id=zp.parent_level
+                        INNER JOIN zones zw
+                        ON zw.level=zp.parent_level AND zw.id=zp.parent
+                        AND COALESCE(zw.code,zw.id::text)=%(within_code)s::text
+                        WHERE zp.child=z.id AND zp.child_level=z.level)
+                    OR (%(zone_level)s=%(within_level)s AND COALESCE(z.code,z.id::text)=%(within_code)s::text))"""
+            )
+        if len(filters):
+            return "WHERE " + " AND ".join(filters)
+        else:
+            return ""
 
     def query(self):
-        return """
-            SELECT q1.id,q1.level,q2.population,q1.name,q1.geometry, q1.area FROM
-                (SELECT z.id,z.level,z.name, ST_AsText(gd.geom) AS geometry, ST_Area(gd.geom,false)/10^6 AS area
+        return f"""
+            WITH selected_zones AS (SELECT z.id,z.level,z.name,gd.geom
                     FROM zones z
                     INNER JOIN zone_levels zl
                     ON zl.name=%(zone_level)s AND zl.id=z."level"
                     INNER JOIN gis_data gd
                     ON gd.zone_id =z.id AND gd.zone_level =z."level"
                     INNER JOIN gis_types gt
-                    ON gd.gis_type =gt.id AND gt."name" =%(target_gt)s) AS q1
+                    ON gd.gis_type =gt.id AND gt."name" =%(target_gt)s
+                    {self.filters_query()})
+            SELECT q1.id,q1.level,q2.population,q1.name,ST_AsBinary(q1.geom) AS geometry, ST_Area(q1.geom,false)/10^6 AS area
+            FROM selected_zones q1
             INNER JOIN
-                (SELECT z.id,z.level,z.name,SUM(za.int_value::double precision*(COALESCE(zp.share,1.)::double precision)) AS population
-                FROM zones z
-                INNER JOIN zone_levels zl
-                ON zl.name=%(zone_level)s AND zl.id=z."level"
+                (SELECT z.id,z.level,SUM(za.int_value::double precision*(COALESCE(zp.share,1.)::double precision)) AS population
+                FROM selected_zones z
                 INNER JOIN zone_parents zp
                 ON zp.parent=z.id AND zp.parent_level=z.level
                 INNER JOIN zone_levels zl2
@@ -56,17 +97,15 @@ class PopulationGetter(GISGetter):
                 ON za.zone=zp.child AND za.zone_level=zp.child_level
                 INNER JOIN zone_attribute_types zat
                 ON zat.id=za.attribute AND zat.name='zs_population'
-                GROUP BY z.id,z.level,z.name
+                GROUP BY z.id,z.level
                     UNION
-                SELECT z.id,z.level,z.name,SUM(za.int_value::real) AS population
-                FROM zones z
-                INNER JOIN zone_levels zl
-                ON zl.name=%(zone_level)s AND zl.id=z."level" AND 'zaehlsprengel'=%(zone_level)s
+                SELECT z.id,z.level,SUM(za.int_value::real) AS population
+                FROM selected_zones z
                 INNER JOIN zone_attributes za
-                ON za.zone=z.id AND za.zone_level=zl.id
+                ON za.zone=z.id AND za.zone_level=z.level AND 'zaehlsprengel'=%(zone_level)s
                 INNER JOIN zone_attribute_types zat
                 ON zat.id=za.attribute AND zat.name='zs_population'
-                GROUP BY z.id,z.level,z.name
+                GROUP BY z.id,z.level
                 ) AS q2
             ON q1.id=q2.id AND q1.level=q2.level
         ;"""
@@ -82,7 +121,7 @@ class PopulationGetter(GISGetter):
             level BIGINT,
             population REAL,
             name TEXT,
-            geometry TEXT,
+            geometry BYTEA,
             area REAL,
             PRIMARY KEY (id,level)
             );
@@ -102,24 +141,28 @@ class PopulationGetter(GISGetter):
             """
         )
 
+    def get_zone_levels(self):
+        if self.within_zone is None:
+            return (self.zone_level, "zaehlsprengel")
+        else:
+            return (self.zone_level, "zaehlsprengel", self.within_zone[0])
+
     def query_attributes(self):
-        return {
+        ans = {
             "zone_level": self.zone_level,
             "zone_attribute": self.zone_attribute,
             "target_gt": self.target_gt,
         }
+        if self.bbox is not None:
+            ans.update(dict(zip(("xmin", "ymin", "xmax", "ymax"), self.bbox)))
+        if self.within_zone is not None:
+            ans["within_level"], ans["within_code"] = self.within_zone
+        return ans
 
-    def parse_results(self, query_result):
-        return [
-            {
-                "Zone": bez,
-                "ZoneID": zid,
-                "population": 0 if np.isnan(pop) else int(pop),
-                "geometry": shapely.wkt.loads(geo),
-                "area": area,
-            }
-            for (zid, zlvl, pop, bez, geo, area) in query_result
-        ]
+    def transform_columns(self, col_dict):
+        pop = col_dict["population"].astype(float)
+        col_dict["population"] = np.where(np.isnan(pop), 0, pop).astype(int)
+        col_dict["area"] = col_dict["area"].astype(float)
 
 
 class PopulationDensityGetter(PopulationGetter):
@@ -129,14 +172,219 @@ class PopulationDensityGetter(PopulationGetter):
 
     columns = ("Zone", "ZoneID", "population_density", "geometry", "area")
 
-    def parse_results(self, query_result):
-        return [
-            {
-                "Zone": bez,
-                "ZoneID": zid,
-                "population_density": 0 if np.isnan(pop) else int(pop) / area,
-                "geometry": shapely.wkt.loads(geo),
-                "area": area,
-            }
-            for (zid, zlvlv, pop, bez, geo, area) in query_result
-        ]
+    def transform_columns(self, col_dict):
+        PopulationGetter.transform_columns(self, col_dict)
+        col_dict["population_density"] = col_dict["population"] / col_dict["area"]
+
+
+def zone_attributes_joins(nb_attributes, zone_alias="z"):
+    """
+    SQL joins adding the latest numerical value of zone attributes as za0.value, za1.value, ... for the zones aliased zone_alias
+    Attribute names are expected as query attributes attribute_0, attribute_1, ...
+    """
+    return "".join(
+        f"""
+            LEFT OUTER JOIN LATERAL (SELECT COALESCE(za.real_value,za.int_value::double precision) AS value
+                FROM zone_attributes za
+                INNER JOIN zone_attribute_types zat
+                ON zat.id=za.attribute AND zat.name=%(attribute_{i})s
+                WHERE za.zone={zone_alias}.id AND za.zone_level={zone_alias}.level
+                ORDER BY za.updated_at DESC
+                LIMIT 1) AS za{i}
+            ON true"""
+        for i in range(nb_attributes)
+    )
+
+
+class ZoneLevelGetter(GISGetter):
+    """
+    Returns a geopandas dataframe with all zones of a zone level, with their geometry, selected numerical zone attributes (latest value) and parent zones at selected levels.
+    When several parents exist at one level (e.g. hexagons), the one with the highest share is taken.
+    Rows are ordered spatially (geohash of the zone centers) if spatial_order is True.
+    """
+
+    def __init__(
+        self,
+        zone_level="bezirk",
+        gis_type="zaehlsprengel",
+        attributes=("zs_population",),
+        parent_levels=(),
+        spatial_order=True,
+        **kwargs,
+    ):
+        GISGetter.__init__(self, **kwargs)
+        self.zone_level = zone_level
+        self.gis_type = gis_type
+        self.attributes = tuple(attributes)
+        self.parent_levels = tuple(parent_levels)
+        self.spatial_order = spatial_order
+        self.columns = (
+            "ZoneID",
+            "code",
+            "Zone",
+            *self.attributes,
+            *[f"{pl}_{c}" for pl in self.parent_levels for c in ("id", "name")],
+            "geometry",
+        )
+        self.result_columns = (
+            *self.columns[:-1],
+            "xmin",
+            "ymin",
+            "xmax",
+            "ymax",
+            "geometry",
+        )
+
+    def get_zone_levels(self):
+        return (self.zone_level, *self.parent_levels)
+
+    def query_attributes(self):
+        ans = {"zone_level": self.zone_level, "gis_type": self.gis_type}
+        for i, attr in enumerate(self.attributes):
+            ans[f"attribute_{i}"] = attr
+        for i, pl in enumerate(self.parent_levels):
+            ans[f"parent_level_{i}"] = pl
+        return ans
+
+    def query(self):
+        attribute_joins = zone_attributes_joins(nb_attributes=len(self.attributes))
+        parent_joins = "".join(
+            f"""
+            LEFT OUTER JOIN LATERAL (SELECT zpz.id,zpz.name
+                FROM zone_parents zp
+                INNER JOIN zone_levels zlp
+                ON zlp.name=%(parent_level_{i})s AND zlp.id=zp.parent_level
+                INNER JOIN zones zpz
+                ON zpz.id=zp.parent AND zpz.level=zp.parent_level
+                WHERE zp.child=z.id AND zp.child_level=z.level
+                ORDER BY zp.share DESC NULLS LAST
+                LIMIT 1) AS zp{i}
+            ON true"""
+            for i in range(len(self.parent_levels))
+        )
+        if self.spatial_order:
+            order = "ST_GeoHash(COALESCE(gd.center,ST_Centroid(gd.geom)),12),z.id"
+        else:
+            order = "z.id"
+        return f"""
+            SELECT z.id,z.code,z.name,
+                {"".join(f"za{i}.value," for i in range(len(self.attributes)))}
+                {"".join(f"zp{i}.id,zp{i}.name," for i in range(len(self.parent_levels)))}
+                ST_XMin(gd.geom),ST_YMin(gd.geom),ST_XMax(gd.geom),ST_YMax(gd.geom),
+                ST_AsBinary(gd.geom) AS geometry
+            FROM zones z
+            INNER JOIN zone_levels zl
+            ON zl.name=%(zone_level)s AND zl.id=z.level
+            INNER JOIN gis_types gt
+            ON gt.name=%(gis_type)s
+            INNER JOIN gis_data gd
+            ON gd.zone_id=z.id AND gd.zone_level=z.level AND gd.gis_type=gt.id
+            {attribute_joins}
+            {parent_joins}
+            ORDER BY {order}
+        ;"""
+
+    def transform_columns(self, col_dict):
+        for attr in self.attributes:
+            col_dict[attr] = col_dict[attr].astype(float)
+
+
+class PointsToZonesGetter(GISGetter):
+    """
+    Returns for each point (longitudes and latitudes in EPSG:4326) the zone containing it at zone_level, and its parents at parent_levels,
+    as columns {level}_id, {level}_code, {level}_name (None if outside of all zones), in input order.
+
+    Points are sent as array parameters, and matched to zones of zone_level with a single join on the GiST index of gis_data.geom;
+    parent zones are then read from zone_parents, without any further spatial predicate
+    (when several parents exist at one level, the one with the highest share is taken).
+    """
+
+    cacheable = False  # results depend on the points
+
+    def __init__(
+        self,
+        long,
+        lat,
+        zone_level="zaehlsprengel",
+        parent_levels=("gemeinde", "bezirk", "bundesland"),
+        gis_type="zaehlsprengel",
+        **kwargs,
+    ):
+        GISGetter.__init__(self, **kwargs)
+        self.long = np.asarray(long, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        if self.long.shape != self.lat.shape or self.long.ndim != 1:
+            raise ValueError(
+                f"long and lat should be 1-dimensional arrays of the same length, got shapes {self.long.shape} and {self.lat.shape}"
+            )
+        self.zone_level = zone_level
+        self.parent_levels = tuple(parent_levels)
+        self.gis_type = gis_type
+        self.levels = (self.zone_level, *self.parent_levels)
+        self.columns = (
+            "long",
+            "lat",
+            *[f"{l}_{c}" for l in self.levels for c in ("id", "code", "name")],
+            "geometry",
+        )
+        self.result_columns = self.columns
+
+    def get_zone_levels(self):
+        return self.levels
+
+    def query_attributes(self):
+        ans = {
+            "long": self.long.tolist(),
+            "lat": self.lat.tolist(),
+            "zone_level": self.zone_level,
+            "gis_type": self.gis_type,
+        }
+        for i, pl in enumerate(self.parent_levels):
+            ans[f"parent_level_{i}"] = pl
+        return ans
+
+    def query(self):
+        parent_joins = "".join(
+            f"""
+            LEFT OUTER JOIN LATERAL (SELECT zpz.id,zpz.code,zpz.name
+                FROM zone_parents zp
+                INNER JOIN zone_levels zlp
+                ON zlp.name=%(parent_level_{i})s AND zlp.id=zp.parent_level
+                INNER JOIN zones zpz
+                ON zpz.id=zp.parent AND zpz.level=zp.parent_level
+                WHERE zp.child=z.id AND zp.child_level=z.level
+                ORDER BY zp.share DESC NULLS LAST
+                LIMIT 1) AS zp{i}
+            ON true"""
+            for i in range(len(self.parent_levels))
+        )
+        return f"""
+            WITH points AS (SELECT p.id,p.long,p.lat,ST_SetSRID(ST_MakePoint(p.long,p.lat),4326) AS geom
+                FROM unnest(%(long)s::double precision[],%(lat)s::double precision[]) WITH ORDINALITY AS p(long,lat,id)),
+            point_zones AS (SELECT pt.id,pz.zone_id,pz.zone_level
+                FROM points pt
+                LEFT OUTER JOIN LATERAL (SELECT gd.zone_id,gd.zone_level
+                    FROM gis_data gd
+                    INNER JOIN zone_levels zl
+                    ON zl.name=%(zone_level)s AND zl.id=gd.zone_level
+                    INNER JOIN gis_types gt
+                    ON gt.name=%(gis_type)s AND gt.id=gd.gis_type
+                    WHERE ST_Intersects(gd.geom,pt.geom)
+                    ORDER BY gd.zone_id
+                    LIMIT 1) AS pz
+                ON true)
+            SELECT pt.long,pt.lat,z.id,z.code,z.name,
+                {"".join(f"zp{i}.id,zp{i}.code,zp{i}.name," for i in range(len(self.parent_levels)))}
+                ST_AsBinary(pt.geom) AS geometry
+            FROM points pt
+            INNER JOIN point_zones pz
+            ON pz.id=pt.id
+            LEFT OUTER JOIN zones z
+            ON z.id=pz.zone_id AND z.level=pz.zone_level
+            {parent_joins}
+            ORDER BY pt.id
+        ;"""
+
+    def transform_columns(self, col_dict):
+        for c in ("long", "lat"):
+            col_dict[c] = col_dict[c].astype(float)
@@ -127,6 +127,13 @@ CREATE INDEX IF NOT EXISTS ca_gist_idx
   ON cached_addresses
   USING GIST (geom);
 
+-- status: resolved, or not_found (geocoder returned nothing, geom is NULL). not_found addresses are retried after a TTL, see AddressPointsGetter
+ALTER TABLE cached_addresses ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'resolved';
+ALTER TABLE cached_addresses ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE cached_addresses ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 1;
+-- address is the normalized address (see geocoding.AddressNormalizer, entries cached before normalization have the raw address), raw_address the first raw form geocoded
+ALTER TABLE cached_addresses ADD COLUMN IF NOT EXISTS raw_address TEXT;
+
 
 CREATE TABLE IF NOT EXISTS geonames_zipcodes(
 country_code TEXT NOT NULL,
@@ -149,3 +156,24 @@ class TEXT,
 args TEXT,
 status TEXT
 );
+
+-- measurements of the steps (prepare, apply, fill_*) of instrumented fillers, attached to their run in _fillers_info (see fillers.instrumentation)
+CREATE TABLE IF NOT EXISTS _fillers_stats(
+id BIGSERIAL PRIMARY KEY,
+filler_info BIGINT,
+class TEXT,
+step TEXT,
+status TEXT,
+started_at TIMESTAMP WITH TIME ZONE,
+seconds DOUBLE PRECISION,
+rows BIGINT,
+bytes_read BIGINT,
+peak_memory BIGINT
+);
+
+-- last filler run (id in _fillers_info) having modified each zone level, used as data version for caches
+CREATE TABLE IF NOT EXISTS _zone_levels_info(
+zone_level TEXT PRIMARY KEY,
+filler_info BIGINT,
+updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,111 @@
+import threading
+import contextlib
+import logging
+
+import psycopg2
+import psycopg2.pool
+
+logger = logging.getLogger(__name__)
+
+
+def format_search_path(search_path):
+    return ",".join('"{}"'.format(s.replace('"', "")) for s in search_path)
+
+
+def parse_search_path(options):
+    """
+    Returns the list of schemas of a '-c search_path=...' connection option (as set by Database)
+    """
+    if options is None:
+        return []
+    opt = options.replace(" ", "")
+    prefix = "-csearch_path="
+    if not opt.startswith(prefix):
+        return []
+    return [s.replace('"', "") for s in opt[len(prefix) :].split(",") if s]
+
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of connections to a database, shared by all Database objects pointing to it whatever their schema.
+
+    Connections are opened without search_path: it is set when a connection is checked out, and only when it differs from the one
+    the connection was last used with (reset to the server default when checked out without search_path).
+    At most maxconn connections are open, checkouts beyond that wait for a connection to be released, and raise
+    psycopg2.pool.PoolError after timeout seconds (None to wait forever).
+    Released connections are rolled back if a transaction was left open.
+    """
+
+    def __init__(self, conninfo, minconn=1, maxconn=10, timeout=60.0):
+        self.conninfo = {k: v for k, v in conninfo.items() if k != "options"}
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn, maxconn, **self.conninfo
+        )
+        self.semaphore = threading.BoundedSemaphore(maxconn)
+        self.lock = threading.Lock()
+        self.search_paths = dict()
+
+    def getconn(self, search_path=(), timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        if not self.semaphore.acquire(timeout=timeout):
+            raise psycopg2.pool.PoolError(
+                f"No connection released in the pool after {timeout} seconds (maxconn={self.maxconn})"
+            )
+        try:
+            connection = self.pool.getconn()
+            search_path = format_search_path(search_path)
+            with self.lock:
+                current = self.search_paths.get(id(connection), "")
+            if search_path != current:
+                with connection.cursor() as cursor:
+                    if search_path:
+                        cursor.execute(f"SET search_path TO {search_path};")
+                    else:
+                        cursor.execute("RESET search_path;")
+                connection.commit()
+                with self.lock:
+                    self.search_paths[id(connection)] = search_path
+        except Exception:
+            self.semaphore.release()
+            raise
+        return connection
+
+    def putconn(self, connection):
+        try:
+            if connection.closed:
+                with self.lock:
+                    self.search_paths.pop(id(connection), None)
+            self.pool.putconn(connection, close=bool(connection.closed))
+        finally:
+            self.semaphore.release()
+
+    @contextlib.contextmanager
+    def connection(self, search_path=(), timeout=None):
+        connection = self.getconn(search_path=search_path, timeout=timeout)
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def close(self):
+        self.pool.closeall()
+        with self.lock:
+            self.search_paths.clear()
+
+
+_connection_pools = dict()
+_registry_lock = threading.Lock()
+
+
+def get_connection_pool(conninfo, **kwargs):
+    """
+    Returns the ConnectionPool of a database (host, port, database and user of conninfo), shared in the process
+    """
+    key = tuple(conninfo.get(k) for k in ("host", "port", "database", "user"))
+    with _registry_lock:
+        if key not in _connection_pools or _connection_pools[key].pool.closed:
+            _connection_pools[key] = ConnectionPool(conninfo=conninfo, **kwargs)
+        return _connection_pools[key]
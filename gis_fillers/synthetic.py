@@ -0,0 +1,445 @@
+"""
+Synthetic input files with the layout of the real sources, to run and stress-test the fillers without network access:
+
+    python -m gis_fillers.synthetic data_folder --zones 10 --vertices 10
+
+writes in data_folder, under the names the fillers look for (so that nothing is downloaded):
+- the ZSP shapefile (EPSG:31287, field g_id) and the population CSV of ZaehlsprengelFiller
+- polbezirke.csv (bezirk and bundesland names)
+- gemliste_knz.csv of PLZFiller
+- geonames_allCountries.zip of GeonamesFiller
+- the GISCO country GeoJSON pair (regions and label points) of CountriesFiller
+
+Zone ids follow the real scheme: bundesland 1 digit, bezirk 3, gemeinde 5 and zaehlsprengel 8 digits, each prefixed by its parent (zz.id/1000=zg.id).
+Zaehlsprengel are cells of a regular grid over the extent of Austria, grouped in rectangular blocks per gemeinde, bezirk and bundesland.
+Their boundaries are sampled with vertices_per_edge points per cell side, jittered deterministically per grid point,
+so that neighbouring zones share exactly the same vertices and their unions (gemeinde, bezirk, ...) have no gaps.
+
+At scale 1 there are 8640 zaehlsprengel (about as many as in the real data) and 32 vertices per zaehlsprengel;
+zones_scale multiplies the number of zaehlsprengel per gemeinde (and of postal codes per country), vertices_scale the number of vertices.
+"""
+
+import os
+import sys
+import csv
+import json
+import zipfile
+import argparse
+import numpy as np
+import pycountry
+import pyproj
+import shapefile
+
+from .fillers import zones
+
+# extent in EPSG:31287 (roughly the bounding box of Austria)
+AUSTRIA_BOUNDS = (110000.0, 280000.0, 690000.0, 580000.0)
+# extent of the country grid, in degrees
+WORLD_BOUNDS = (-180.0, -60.0, 180.0, 80.0)
+
+BUNDESLAENDER = (
+    "Burgenland",
+    "Kärnten",
+    "Niederösterreich",
+    "Oberösterreich",
+    "Salzburg",
+    "Steiermark",
+    "Tirol",
+    "Vorarlberg",
+    "Wien",
+)
+
+# layout of each level in blocks of the level below (columns, rows)
+BUNDESLAND_GRID = (3, 3)
+BEZIRK_GRID = (5, 4)
+GEMEINDE_GRID = (4, 3)
+ZS_PER_GEMEINDE = 4
+VERTICES_PER_EDGE = 8
+
+# GISCO country ids differing from ISO 3166 alpha-2
+GISCO_CODES = {"GR": "EL", "GB": "UK"}
+
+
+def block_shape(n):
+    """
+    Returns (columns, rows) of a block of n cells, as square as possible
+    """
+    cols = int(np.sqrt(n))
+    while n % cols:
+        cols -= 1
+    return n // cols, cols
+
+
+def ring_template(n):
+    """
+    Offsets (in grid points) of the clockwise boundary ring of a cell with n points per side, closed
+    """
+    k = np.arange(n)
+    ans = np.concatenate(
+        [
+            np.stack([np.zeros(n), k], axis=1),
+            np.stack([k, np.full(n, n)], axis=1),
+            np.stack([np.full(n, n), n - k], axis=1),
+            np.stack([n - k, np.zeros(n)], axis=1),
+            [[0, 0]],
+        ]
+    )
+    return ans.astype(np.int64)
+
+
+def jitter(i, j, seed):
+    """
+    Deterministic pseudo-random values in [-0.5,0.5) for integer grid points (i,j)
+    """
+    h = (i * 73856093) ^ (j * 19349663) ^ (seed * 83492791)
+    h = (h ^ (h >> 13)) * 1274126177
+    return ((h ^ (h >> 16)) & 0xFFFF) / 65536.0 - 0.5
+
+
+def cell_rings(cells, nx, ny, bounds, vertices_per_edge, seed=0, clockwise=True):
+    """
+    Boundary rings (array (len(cells),4*vertices_per_edge+1,2)) of cells (array of (column,row)) of a nx*ny grid over bounds.
+    Grid points are jittered by at most a fifth of the distance between points, identically for all cells sharing them.
+    """
+    x0, y0, x1, y1 = bounds
+    n = vertices_per_edge
+    dx = (x1 - x0) / (nx * n)
+    dy = (y1 - y0) / (ny * n)
+    template = ring_template(n)
+    if not clockwise:
+        template = template[::-1]
+    cells = np.asarray(cells, dtype=np.int64)
+    i = cells[:, 0, None] * n + template[None, :, 0]
+    j = cells[:, 1, None] * n + template[None, :, 1]
+    # points on the outer boundary are kept in place
+    inner_i = (i > 0) & (i < nx * n)
+    inner_j = (j > 0) & (j < ny * n)
+    x = x0 + dx * (i + 0.4 * jitter(i, j, seed) * inner_i * inner_j)
+    y = y0 + dy * (j + 0.4 * jitter(j, i, seed + 1) * inner_i * inner_j)
+    return np.stack([x, y], axis=2)
+
+
+class SyntheticDataGenerator(object):
+    """
+    Writes synthetic input files of ZaehlsprengelFiller, PLZFiller, GeonamesFiller and CountriesFiller in a data folder (see module docstring).
+    """
+
+    def __init__(
+        self,
+        zones_scale=1,
+        vertices_scale=1,
+        seed=0,
+        year=2023,
+        countries_year=None,
+        chunk_size=10**4,
+    ):
+        if ZS_PER_GEMEINDE * zones_scale > 1000:
+            raise ValueError(
+                f"zones_scale should be at most {1000 // ZS_PER_GEMEINDE} (zaehlsprengel ids have 3 digits per gemeinde), not {zones_scale}"
+            )
+        self.zones_scale = zones_scale
+        self.vertices_scale = vertices_scale
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.zs_filler = zones.zaehlsprengel.ZaehlsprengelFiller(year=year)
+        self.plz_filler = zones.zaehlsprengel.PLZFiller()
+        self.geonames_filler = zones.geonames.GeonamesFiller()
+        self.countries_filler = zones.countries.CountriesFiller(year=countries_year)
+
+        self.zs_block = block_shape(ZS_PER_GEMEINDE * zones_scale)
+        self.vertices_per_edge = VERTICES_PER_EDGE * vertices_scale
+        self.nx = (
+            BUNDESLAND_GRID[0] * BEZIRK_GRID[0] * GEMEINDE_GRID[0] * self.zs_block[0]
+        )
+        self.ny = (
+            BUNDESLAND_GRID[1] * BEZIRK_GRID[1] * GEMEINDE_GRID[1] * self.zs_block[1]
+        )
+        self.rng = np.random.default_rng(seed)
+
+    def zone_ids(self, cells):
+        """
+        Returns arrays of zaehlsprengel, gemeinde, bezirk and bundesland ids of grid cells
+        """
+        ix, iy = cells[:, 0], cells[:, 1]
+        zx, zy = self.zs_block
+        gx, gy = GEMEINDE_GRID
+        bx, by = BEZIRK_GRID
+        g_i, g_j = ix // zx, iy // zy
+        b_i, b_j = g_i // gx, g_j // gy
+        bl_i, bl_j = b_i // bx, b_j // by
+        bundesland = bl_j * BUNDESLAND_GRID[0] + bl_i + 1
+        bezirk = bundesland * 100 + (b_j % by) * bx + b_i % bx + 1
+        gemeinde = bezirk * 100 + (g_j % gy) * gx + g_i % gx + 1
+        zs = gemeinde * 1000 + (iy % zy) * zx + ix % zx
+        return zs, gemeinde, bezirk, bundesland
+
+    def iter_cells(self):
+        """
+        Yields chunks of grid cells (array of (column,row)), ordered by zaehlsprengel id
+        """
+        cells = np.stack(
+            np.meshgrid(np.arange(self.nx), np.arange(self.ny), indexing="ij"), axis=-1
+        ).reshape(-1, 2)
+        cells = cells[np.argsort(self.zone_ids(cells)[0], kind="stable")]
+        for start in range(0, len(cells), self.chunk_size):
+            yield cells[start : start + self.chunk_size]
+
+    @property
+    def nb_zs(self):
+        return self.nx * self.ny
+
+    def write_zaehlsprengel(self, data_folder):
+        """
+        Shapefile (with .prj and .cpg) and population CSV, with a title row and a source footer like the converted spreadsheet
+        """
+        shp_path = os.path.join(data_folder, self.zs_filler.gis_info_fullname)
+        os.makedirs(os.path.dirname(shp_path), exist_ok=True)
+        with open(shp_path[: -len(".shp")] + ".prj", "w") as f:
+            f.write(
+                pyproj.CRS.from_epsg(31287).to_wkt(pyproj.enums.WktVersion.WKT1_ESRI)
+            )
+        with open(shp_path[: -len(".shp")] + ".cpg", "w") as f:
+            f.write("UTF-8")
+
+        with shapefile.Writer(
+            shp_path, shapeType=shapefile.POLYGON, encoding="utf-8"
+        ) as sf, open(
+            os.path.join(data_folder, self.zs_filler.pop_info_name + ".csv"),
+            "w",
+            newline="",
+        ) as f:
+            sf.field("g_id", "C", size=10)
+            sf.field("g_name", "C", size=60)
+            writer = csv.writer(f)
+            writer.writerow(
+                [
+                    f"Bevölkerung am 1.1.{self.zs_filler.year} nach Zählsprengel (synthetisch)"
+                ]
+            )
+            writer.writerow(
+                [
+                    "Bundesland",
+                    "Gemeindekennziffer",
+                    "Gemeindename",
+                    "Zählsprengel",
+                    "Zählsprengelname",
+                    "Bevölkerung",
+                ]
+            )
+            for cells in self.iter_cells():
+                zs, gemeinde, bezirk, bundesland = self.zone_ids(cells)
+                rings = cell_rings(
+                    cells,
+                    nx=self.nx,
+                    ny=self.ny,
+                    bounds=AUSTRIA_BOUNDS,
+                    vertices_per_edge=self.vertices_per_edge,
+                    seed=self.seed,
+                )
+                population = self.rng.integers(0, 2000, len(cells))
+                for z, g, bl, ring, pop in zip(
+                    zs, gemeinde, bundesland, rings, population
+                ):
+                    sf.poly([ring.tolist()])
+                    sf.record(str(z), f"Zählsprengel {z}")
+                    writer.writerow(
+                        [bl, g, f"Gemeinde {g}", z, f"Zählsprengel {z}", pop]
+                    )
+            writer.writerow(
+                [
+                    "Q: STATISTIK AUSTRIA, Statistik des Bevölkerungsstandes. Synthetische Daten."
+                ]
+            )
+
+    def iter_bezirke(self):
+        nb_bezirke = BEZIRK_GRID[0] * BEZIRK_GRID[1]
+        for bl, bl_name in enumerate(BUNDESLAENDER, start=1):
+            for k in range(1, nb_bezirke + 1):
+                yield bl, bl_name, bl * 100 + k
+
+    def write_bezirke(self, data_folder):
+        """
+        polbezirke.csv: ';'-separated, 3 header lines and a footer line
+        """
+        with open(
+            os.path.join(data_folder, self.zs_filler.bezirk_info_name), "w", newline=""
+        ) as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(["Politische Bezirke (synthetisch)"])
+            writer.writerow([])
+            writer.writerow(
+                [
+                    "Bundesland-Code",
+                    "Bundesland",
+                    "Bezirkskennziffer",
+                    "Politischer Bezirk",
+                    "Politischer Bezirk Code",
+                ]
+            )
+            for bl, bl_name, bz in self.iter_bezirke():
+                writer.writerow([bl, bl_name, bz, f"Bezirk {bz}", bz])
+            writer.writerow(["Quelle: STATISTIK AUSTRIA (synthetisch)"])
+
+    def write_plz(self, data_folder):
+        """
+        gemliste_knz.csv: one postal code per gemeinde, ';'-separated, 3 header lines and a footer line
+        """
+        nb_gemeinden = GEMEINDE_GRID[0] * GEMEINDE_GRID[1]
+        with open(
+            os.path.join(data_folder, self.plz_filler.file_info_name), "w", newline=""
+        ) as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(["Gemeindeliste (synthetisch)"])
+            writer.writerow([])
+            writer.writerow(
+                [
+                    "Gemeindekennziffer",
+                    "Gemeindename",
+                    "Gemeindecode",
+                    "Status",
+                    "PLZ des Gem.Amtes",
+                    "weitere Postleitzahlen",
+                ]
+            )
+            plz = 1000
+            for bl, bl_name, bz in self.iter_bezirke():
+                for k in range(1, nb_gemeinden + 1):
+                    g = bz * 100 + k
+                    writer.writerow([g, f"Gemeinde {g}", g, "", plz, ""])
+                    plz += 1
+            writer.writerow(["Quelle: STATISTIK AUSTRIA (synthetisch)"])
+
+    def country_list(self):
+        return sorted(pycountry.countries, key=lambda c: c.alpha_2)
+
+    def country_grid(self):
+        nb_countries = len(self.country_list())
+        nx = int(np.ceil(np.sqrt(nb_countries)))
+        return nx, int(np.ceil(nb_countries / nx))
+
+    def write_countries(self, data_folder):
+        """
+        GISCO GeoJSON pair: polygons (RG) and label points (LB), features identified by GISCO country ids
+        """
+        countries = self.country_list()
+        nx, ny = self.country_grid()
+        cells = np.array([(k % nx, k // nx) for k in range(len(countries))])
+        rings = cell_rings(
+            cells,
+            nx=nx,
+            ny=ny,
+            bounds=WORLD_BOUNDS,
+            vertices_per_edge=self.vertices_per_edge,
+            seed=self.seed,
+            clockwise=False,
+        )
+        rg_features = []
+        lb_features = []
+        for c, ring in zip(countries, rings):
+            code = GISCO_CODES.get(c.alpha_2, c.alpha_2)
+            properties = dict(
+                CNTR_ID=code,
+                CNTR_NAME=c.name,
+                NAME_ENGL=c.name,
+                ISO3_CODE=c.alpha_3,
+                FID=code,
+            )
+            rg_features.append(
+                dict(
+                    type="Feature",
+                    id=code,
+                    properties=properties,
+                    geometry=dict(type="Polygon", coordinates=[ring.tolist()]),
+                )
+            )
+            lb_features.append(
+                dict(
+                    type="Feature",
+                    id=code,
+                    properties=properties,
+                    geometry=dict(
+                        type="Point", coordinates=ring[:-1].mean(axis=0).tolist()
+                    ),
+                )
+            )
+        for filename, features in (
+            (self.countries_filler.fullgeojson_gis_info_name, rg_features),
+            (self.countries_filler.LBgeojson_gis_info_name, lb_features),
+        ):
+            path = os.path.join(data_folder, filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(dict(type="FeatureCollection", features=features), f)
+
+    def write_geonames(self, data_folder):
+        """
+        geonames zip with allCountries.txt (12 tab-separated columns), 100*zones_scale postal codes per country,
+        located within the country polygon, or within the zaehlsprengel grid for AT
+        """
+        nb_codes = 100 * self.zones_scale
+        nx, ny = self.country_grid()
+        x0, y0, x1, y1 = WORLD_BOUNDS
+        to_wgs84 = pyproj.Transformer.from_crs(31287, 4326, always_xy=True)
+        with zipfile.ZipFile(
+            os.path.join(data_folder, self.geonames_filler.zipname),
+            "w",
+            compression=zipfile.ZIP_DEFLATED,
+        ) as zf, zf.open("allCountries.txt", "w") as f:
+            for k, c in enumerate(self.country_list()):
+                if c.alpha_2 == "AT":
+                    ax0, ay0, ax1, ay1 = AUSTRIA_BOUNDS
+                    long, lat = to_wgs84.transform(
+                        self.rng.uniform(ax0, ax1, nb_codes),
+                        self.rng.uniform(ay0, ay1, nb_codes),
+                    )
+                    zip_codes = [str(1000 + i) for i in range(nb_codes)]
+                else:
+                    # margin to stay within the jittered boundaries
+                    i, j = k % nx, k // nx
+                    w, h = (x1 - x0) / nx, (y1 - y0) / ny
+                    long = self.rng.uniform(
+                        x0 + (i + 0.1) * w, x0 + (i + 0.9) * w, nb_codes
+                    )
+                    lat = self.rng.uniform(
+                        y0 + (j + 0.1) * h, y0 + (j + 0.9) * h, nb_codes
+                    )
+                    zip_codes = [f"{n:05d}" for n in range(nb_codes)]
+                f.write(
+                    "".join(
+                        f"{c.alpha_2}\t{z}\tPlace {z}\t\t\t\t\t\t\t{la:.4f}\t{lo:.4f}\t4\n"
+                        for z, lo, la in zip(zip_codes, long, lat)
+                    ).encode("utf8")
+                )
+
+    def generate(self, data_folder):
+        os.makedirs(data_folder, exist_ok=True)
+        self.write_zaehlsprengel(data_folder)
+        self.write_bezirke(data_folder)
+        self.write_plz(data_folder)
+        self.write_countries(data_folder)
+        self.write_geonames(data_folder)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m gis_fillers.synthetic")
+    parser.add_argument("data_folder")
+    parser.add_argument("--zones", type=int, default=1)
+    parser.add_argument("--vertices", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--year", type=int, default=2023)
+    args = parser.parse_args(argv)
+    generator = SyntheticDataGenerator(
+        zones_scale=args.zones,
+        vertices_scale=args.vertices,
+        seed=args.seed,
+        year=args.year,
+    )
+    generator.generate(args.data_folder)
+    print(
+        f"{generator.nb_zs} zaehlsprengel, {4 * generator.vertices_per_edge} vertices each, written in {args.data_folder}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import pytest
 import os
+import psycopg2.pool
 import glob
+from concurrent.futures import ThreadPoolExecutor
 
 import gis_fillers as gf
 from gis_fillers import Database
@@ -38,7 +40,64 @@ def maindb():
     db = Database(**conninfo)
     db.init_db()
     yield db
-    db.connection.close()
+    db.close()
+
+
+def test_connection_pool(maindb):
+    gis_db = maindb.get_gis_db(fill_db=False)
+    assert gis_db.connection_pool is maindb.connection_pool
+    gis_db.cursor.execute("SELECT current_schema();")
+    assert gis_db.cursor.fetchone()[0] == "postgis"
+
+    def count_levels(_):
+        with maindb.checkout() as task_db:
+            task_db.cursor.execute("SELECT COUNT(*) FROM zone_levels;")
+            return task_db.cursor.fetchone()[0]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        counts = list(executor.map(count_levels, range(8)))
+    assert len(set(counts)) == 1
+
+
+def test_connection_pool_release(maindb):
+    connection_pool = maindb.connection_pool
+    connection = connection_pool.getconn(search_path=["postgis"])
+    connection_pool.putconn(connection)
+    with connection_pool.connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_schema();")
+            assert cursor.fetchone()[0] != "postgis"
+
+    maindb.get_gis_db(fill_db=False)
+    maindb.release_gis_db()
+    assert not hasattr(maindb, "gis_db")
+    connections = [
+        connection_pool.getconn(timeout=1) for _ in range(connection_pool.maxconn)
+    ]
+    with pytest.raises(psycopg2.pool.PoolError):
+        connection_pool.getconn(timeout=0.1)
+    for connection in connections:
+        connection_pool.putconn(connection)
+
+    getter = zone_getters.ZoneLevelGetter(zone_level="country", attributes=())
+    result = getter.get_result(db=maindb, pooled=True)
+    assert getter.db is None
+    assert len(result) == len(getter.get_result(db=maindb))
+
+
+def test_gis_db_outside_pool(maindb):
+    # gis_db connections are not taken from the pool, which stays available for checkout
+    databases = [Database(**conninfo) for _ in range(maindb.pool_maxconn + 1)]
+    for db in databases:
+        gis_db = db.get_gis_db(fill_db=False)
+        gis_db.cursor.execute("SELECT current_schema();")
+        assert gis_db.cursor.fetchone()[0] == "postgis"
+    with maindb.connection_pool.connection(timeout=1) as connection:
+        assert not connection.closed
+    for db in databases:
+        db.close()
+        assert not hasattr(db, "gis_db")
+        assert db.connection.closed
 
 
 def test_countries(maindb):
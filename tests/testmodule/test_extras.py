@@ -1,11 +1,24 @@
 import pytest
 import os
 import glob
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import shapely.wkt
 
 import gis_fillers as gf
-from gis_fillers import Database
+from gis_fillers import Database, benchmarks, synthetic
 from gis_fillers.fillers import zones, loc_resolver
-from gis_fillers.getters import zone_getters, generic_getters
+from gis_fillers.getters import (
+    zone_getters,
+    generic_getters,
+    exporters,
+    tile_getters,
+    sampling,
+    spatial_index,
+    GetterCache,
+)
 
 conninfo = {
     "host": "localhost",
@@ -25,12 +38,20 @@ def maindb():
     db.add_filler(zones.geonames.GeonamesFiller())
     db.fill_db()
     yield db
-    db.connection.close()
+    db.close()
 
 
 getters_list = [
     (zone_getters.PopulationGetter, dict(zone_level="bezirk", simplified=False)),
     (zone_getters.PopulationDensityGetter, dict(zone_level="bezirk", simplified=False)),
+    (
+        zone_getters.PopulationGetter,
+        dict(zone_level="zaehlsprengel", bbox=(16.18, 48.11, 16.58, 48.33)),
+    ),
+    (
+        zone_getters.PopulationDensityGetter,
+        dict(zone_level="gemeinde", simplified=False, within_zone=("bezirk", 918)),
+    ),
     (
         generic_getters.AreaPointsGetter,
         dict(zone_level="bezirk", location_list=["101", "918", "902"] * 10),
@@ -39,6 +60,15 @@ getters_list = [
         generic_getters.AreaPointsGetter,
         dict(zone_level="country", location_list=["AT", "FR", "TR"] * 10),
     ),
+    (
+        generic_getters.AreaPointsGetter,
+        dict(
+            zone_level="country",
+            location_list=["AT", "FR", "TR"] * 10,
+            use_sampling_index=True,
+            seed=0,
+        ),
+    ),
     (
         generic_getters.AreaPointsGetter,
         dict(
@@ -48,6 +78,17 @@ getters_list = [
             add_noise=True,
         ),
     ),
+    (
+        generic_getters.AreaPointsGetter,
+        dict(
+            zone_level="country",
+            location_list=["AT", "FR", "TR"] * 10,
+            noise_size=1000,
+            noise_unit="meters",
+            add_noise=True,
+            seed=0,
+        ),
+    ),
     (
         generic_getters.AreaPointsGetter,
         dict(
@@ -117,6 +158,21 @@ getters_list = [
             country_language="de",
         ),
     ),
+    (
+        generic_getters.ZipPointsGetter,
+        dict(
+            location_list=[("FR", "33400"), ("AT", "1080")] * 10,
+            use_temp_table=True,
+        ),
+    ),
+    (
+        generic_getters.AreaPointsGetter,
+        dict(
+            zone_level="bezirk",
+            location_list=["101", "918", "902"] * 10,
+            use_temp_table=True,
+        ),
+    ),
 ]
 
 
@@ -129,6 +185,371 @@ def test_getters(maindb, getter):
     getter[0](db=maindb, **getter[1]).get_result()
 
 
+iter_getters_list = [
+    (zone_getters.PopulationGetter, dict(zone_level="gemeinde", simplified=False)),
+    (
+        generic_getters.ZipPointsGetter,
+        dict(
+            location_list=[("FR", "33400"), ("AT", "1080")] * 10,
+        ),
+    ),
+]
+
+
+@pytest.fixture(params=iter_getters_list)
+def iter_getter(request):
+    return request.param
+
+
+def test_getters_iter(maindb, iter_getter):
+    full_result = iter_getter[0](db=maindb, **iter_getter[1]).get_result()
+    chunks = list(iter_getter[0](db=maindb, **iter_getter[1]).iter_result(chunk_size=7))
+    assert all(len(c) <= 7 for c in chunks)
+    assert sum(len(c) for c in chunks) == len(full_result)
+    if "location" in full_result.columns:
+        assert [l for c in chunks for l in c["location"]] == list(
+            full_result["location"]
+        )
+
+
+@pytest.mark.parametrize(
+    "getter_class",
+    [zone_getters.PopulationGetter, zone_getters.PopulationDensityGetter],
+)
+def test_parse_columns(getter_class):
+    # column-wise WKB parsing gives the same GeoDataFrame as the former per-row construction
+    geoms = [
+        shapely.box(16.0, 48.0, 16.5, 48.5),
+        shapely.MultiPolygon([shapely.box(0, 0, 1, 1), shapely.box(2, 2, 3, 3)]),
+        shapely.Polygon(
+            [(0, 0), (1, 0), (0.5, 1)], holes=[[(0.4, 0.2), (0.6, 0.2), (0.5, 0.4)]]
+        ),
+    ]
+    populations = [1200.0, np.nan, 35.0]
+    areas = [12.5, 3.0, 0.7]
+    # rows as returned by psycopg2: WKB geometries as memoryview
+    query_result = [
+        (i, 3, pop, f"zone {i}", memoryview(shapely.to_wkb(g)), area)
+        for i, (g, pop, area) in enumerate(zip(geoms, populations, areas))
+    ]
+    getter = getter_class(zone_level="bezirk")
+    gdf = getter.build_gdf(getter.parse_columns(query_result=query_result))
+
+    # per-row construction, from WKT geometries
+    value_column = getter.columns[2]
+    expected = gpd.GeoDataFrame(
+        [
+            {
+                "Zone": name,
+                "ZoneID": zid,
+                value_column: (
+                    0
+                    if np.isnan(pop)
+                    else (int(pop) if value_column == "population" else int(pop) / area)
+                ),
+                "geometry": shapely.wkt.loads(shapely.to_wkt(g)),
+                "area": area,
+            }
+            for (zid, _, pop, name, _, area), g in zip(query_result, geoms)
+        ],
+        crs="epsg:4326",
+        columns=getter.columns,
+    )
+    assert gdf.crs == expected.crs
+    assert list(gdf.columns) == list(expected.columns)
+    assert (gdf.dtypes == expected.dtypes).all()
+    assert gdf.geometry.geom_equals(expected.geometry).all()
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(gdf.drop(columns="geometry")),
+        pd.DataFrame(expected.drop(columns="geometry")),
+    )
+    assert getter.parse_results(query_result=query_result)[1]["geometry"].equals(
+        geoms[1]
+    )
+
+    empty = getter.build_gdf(getter.parse_columns(query_result=[]))
+    assert len(empty) == 0
+    assert list(empty.columns) == list(getter.columns)
+    assert empty.crs == expected.crs
+
+
+def test_scoped_getters(maindb):
+    full = zone_getters.PopulationGetter(db=maindb, zone_level="bezirk").get_result()
+    vienna = zone_getters.PopulationGetter(
+        db=maindb, zone_level="bezirk", within_zone=("bundesland", 9)
+    ).get_result()
+    assert 0 < len(vienna) < len(full)
+    assert set(vienna["ZoneID"]) <= set(full["ZoneID"])
+    bbox_result = zone_getters.PopulationGetter(
+        db=maindb, zone_level="bezirk", bbox=(16.18, 48.11, 16.58, 48.33)
+    ).get_result()
+    assert set(vienna["ZoneID"]) <= set(bbox_result["ZoneID"])
+    assert len(bbox_result) < len(full)
+
+
+@pytest.mark.parametrize("use_temp_table", [False, True])
+def test_area_points_order(maindb, use_temp_table):
+    location_list = ["101", "918", "902"] * 10 + ["unknown"]
+    gdf = generic_getters.AreaPointsGetter(
+        db=maindb,
+        zone_level="bezirk",
+        location_list=location_list,
+        use_temp_table=use_temp_table,
+    ).get_result()
+    assert list(gdf["location"]) == location_list
+    assert gdf["geometry"].iloc[:-1].notna().all()
+    assert gdf["geometry"].iloc[-1] is None
+    assert len(set(gdf["geometry"].iloc[:-1].to_wkb())) == len(location_list) - 1
+
+
+def test_metric_noise(maindb):
+    kwargs = dict(
+        db=maindb,
+        zone_level="bezirk",
+        location_list=["101", "918", "902"] * 10,
+        use_sampling_index=True,
+        seed=1,
+    )
+    gdf = generic_getters.AreaPointsGetter(**kwargs).get_result()
+    noisy_gdf = generic_getters.AreaPointsGetter(
+        add_noise=True, noise_size=500, noise_unit="meters", **kwargs
+    ).get_result()
+    assert noisy_gdf.equals(
+        generic_getters.AreaPointsGetter(
+            add_noise=True, noise_size=500, noise_unit="meters", **kwargs
+        ).get_result()
+    )
+    distances = noisy_gdf.to_crs(31287).distance(gdf.to_crs(31287))
+    assert (distances < 501).all() and (distances > 0).all()
+
+
+def test_sampling_index(maindb, tmp_path):
+    location_list = ["101", "918", "902"] * 100 + ["unknown"]
+    gdf = generic_getters.AreaPointsGetter(
+        db=maindb,
+        zone_level="bezirk",
+        location_list=location_list,
+        use_sampling_index=True,
+        sampling_cache_folder=str(tmp_path),
+        seed=0,
+    ).get_result()
+    assert list(gdf["location"]) == location_list
+    assert gdf["geometry"].iloc[-1] is None
+    zones_gdf = zone_getters.ZoneLevelGetter(
+        db=maindb, zone_level="bezirk", attributes=()
+    ).get_result()
+    zones_gdf = zones_gdf.set_index("code")
+    for code in ("101", "918", "902"):
+        points = gdf[gdf["location"] == code]["geometry"]
+        assert points.within(zones_gdf.loc[code, "geometry"].buffer(10**-9)).all()
+
+    assert len(glob.glob(os.path.join(str(tmp_path), "*.npz"))) == 1
+    sampler = sampling.ZonePointsSampler(
+        db=maindb,
+        zone_level="bezirk",
+        points_per_zone={"101": 1000, "918": 10},
+        cache_folder=str(tmp_path),
+    )
+    assert sampler.get_result()["location"].value_counts().to_dict() == {
+        "101": 1000,
+        "918": 10,
+    }
+
+
+def test_points_to_zones(maindb):
+    location_list = ["101", "918", "902"] * 10
+    points = generic_getters.AreaPointsGetter(
+        db=maindb, zone_level="bezirk", location_list=location_list, seed=0
+    ).get_result()
+    gdf = zone_getters.PointsToZonesGetter(
+        db=maindb,
+        long=list(points["long"]) + [0.0],
+        lat=list(points["lat"]) + [0.0],
+    ).get_result()
+    assert list(gdf["bezirk_code"].iloc[:-1]) == location_list
+    assert gdf["zaehlsprengel_id"].iloc[:-1].notna().all()
+    assert gdf["bezirk_id"].isna().iloc[-1]
+    assert gdf["long"].iloc[-1] == 0.0
+
+
+def test_zone_index(maindb):
+    location_list = ["101", "918", "902"] * 10
+    points = generic_getters.AreaPointsGetter(
+        db=maindb, zone_level="bezirk", location_list=location_list, seed=0
+    ).get_result()
+    manager = spatial_index.ZoneIndexManager()
+    index = manager.get_index(db=maindb, zone_level="bezirk")
+    located = index.locate(long=points["long"], lat=points["lat"])
+    assert list(located["code"]) == location_list
+    assert index.contains(long=[0.0], lat=[0.0])[0] == -1
+    assert manager.get_index(db=maindb, zone_level="bezirk") is index
+    assert manager.stats()["version_checks"] == 1
+
+    manager.memory_budget = index.nbytes
+    bundesland_index = manager.get_index(db=maindb, zone_level="bundesland")
+    assert manager.stats()["levels"] == ["bundesland"]
+    assert manager.stats()["evictions"] == 1
+
+    filler = zones.countries.CountriesFiller()
+    filler.db = maindb
+    filler.register_zone_levels("bundesland")
+    # versions are cached for version_ttl seconds
+    assert manager.get_index(db=maindb, zone_level="bundesland") is bundesland_index
+    manager.refresh()
+    assert manager.get_index(db=maindb, zone_level="bundesland") is not bundesland_index
+    assert manager.stats()["misses"] == 3
+
+
+def test_benchmark_getters(maindb):
+    recorder = benchmarks.BenchmarkRecorder(db=maindb)
+    getters = dict(benchmarks.default_getters(nb_points=99))
+    recorder.run_getters(
+        [
+            (name, getters[name])
+            for name in ("AreaPointsGetter.bezirk", "ZoneIndex.bezirk")
+        ],
+        repeat=2,
+    )
+    assert [r["name"] for r in recorder.results] == ["AreaPointsGetter.bezirk"] * 2 + [
+        "ZoneIndex.bezirk"
+    ] * 2
+    assert recorder.results[0]["rows"] == 99
+    report = benchmarks.build_report(db=maindb, results=recorder.results)
+    comparison = benchmarks.compare_reports(report, report)
+    assert [c["ratio"] for c in comparison] == [1.0, 1.0]
+
+
+def test_synthetic_data(tmp_path):
+    generator = synthetic.SyntheticDataGenerator(zones_scale=2, chunk_size=1000)
+    generator.generate(str(tmp_path))
+    db = Database(
+        db_schema="gis_fillers_synthetic", **dict(conninfo, data_folder=str(tmp_path))
+    )
+    db.clean_db()
+    db.init_db()
+    db.add_filler(zones.zaehlsprengel.ZaehlsprengelFiller())
+    db.add_filler(zones.zaehlsprengel.PLZFiller())
+    db.add_filler(zones.geonames.GeonamesFiller())
+    db.add_filler(zones.countries.CountriesFiller())
+    db.fill_db()
+    counts = dict()
+    for level in ("zaehlsprengel", "gemeinde", "bezirk", "bundesland"):
+        db.cursor.execute(
+            """SELECT COUNT(*) FROM zones z
+                INNER JOIN zone_levels zl ON zl.id=z.level AND zl.name=%s
+                INNER JOIN gis_data gd ON gd.zone_id=z.id AND gd.zone_level=z.level;""",
+            (level,),
+        )
+        counts[level] = db.cursor.fetchone()[0]
+    assert counts == dict(
+        zaehlsprengel=generator.nb_zs, gemeinde=2160, bezirk=180, bundesland=9
+    )
+    db.cursor.execute("SELECT COUNT(*) FROM geonames_zipcodes;")
+    assert db.cursor.fetchone()[0] == 200 * len(generator.country_list())
+    db.connection.close()
+
+
+def test_filler_stats(tmp_path):
+    synthetic.SyntheticDataGenerator().generate(str(tmp_path))
+    db = Database(
+        db_schema="gis_fillers_stats", **dict(conninfo, data_folder=str(tmp_path))
+    )
+    db.clean_db()
+    db.init_db()
+    records = []
+    metrics_file = os.path.join(str(tmp_path), "fillers.prom")
+    filler = zones.zaehlsprengel.ZaehlsprengelFiller(
+        stats_callback=records.append, metrics_file=metrics_file
+    )
+    db.add_filler(filler)
+    db.fill_db()
+    steps = {r["step"]: r for r in records}
+    assert records[-1]["step"] == "apply"
+    # rows are only counted for the outermost steps
+    assert steps["fill_zs"]["rows"] is None
+    assert steps["fill_zs"]["bytes_read"] == os.path.getsize(
+        os.path.join(str(tmp_path), filler.pop_info_name + ".csv")
+    )
+    assert steps["apply"]["rows"] >= 2 * 8640  # zones and geometries of zaehlsprengel
+    assert steps["apply"]["seconds"] >= steps["fill_zs"]["seconds"]
+    assert steps["fill_population"]["bytes_read"] == steps["fill_zs"]["bytes_read"]
+    assert steps["apply"]["peak_memory"] is None
+
+    db.cursor.execute(
+        """SELECT fs.step,fs.rows FROM _fillers_stats fs
+            INNER JOIN _fillers_info fi ON fi.id=fs.filler_info AND fi.status='init_apply'
+            WHERE fs.class='ZaehlsprengelFiller';"""
+    )
+    assert dict(db.cursor.fetchall())["apply"] == steps["apply"]["rows"]
+    with open(metrics_file) as f:
+        metrics = f.read()
+    assert (
+        f'gis_fillers_step_rows{{filler="ZaehlsprengelFiller",step="apply"}} {steps["apply"]["rows"]}'
+        in metrics
+    )
+    assert metrics.endswith("# EOF\n")
+    db.connection.close()
+
+
+def test_getter_cache(maindb, tmp_path):
+    cache = GetterCache(cache_folder=str(tmp_path))
+    getter = zone_getters.PopulationGetter(db=maindb, zone_level="bezirk")
+    gdf1 = getter.get_result(cache=cache)
+    gdf2 = getter.get_result(cache=cache)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert gdf1.equals(gdf2)
+
+    filler = zones.countries.CountriesFiller()
+    filler.db = maindb
+    filler.register_zone_levels("country")  # other levels are not invalidated
+    getter.get_result(cache=cache)
+    assert cache.stats()["hits"] == 2
+    filler.register_zone_levels("bezirk")
+    getter.get_result(cache=cache)
+    assert cache.stats()["misses"] == 2
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "fgb"])
+def test_export_zone_level(maindb, tmp_path, file_format):
+    filepath = str(tmp_path / f"gemeinde.{file_format}")
+    exporters.ZoneLevelExporter(
+        db=maindb,
+        zone_level="gemeinde",
+        parent_levels=("bezirk", "bundesland"),
+    ).export_result(filepath=filepath, chunk_size=500)
+    gdf = (
+        gpd.read_parquet(filepath)
+        if file_format == "parquet"
+        else gpd.read_file(filepath)
+    )
+    expected = zone_getters.ZoneLevelGetter(
+        db=maindb, zone_level="gemeinde", parent_levels=("bezirk", "bundesland")
+    ).get_result()
+    assert len(gdf) == len(expected)
+    assert set(gdf.columns) == set(expected.columns)
+
+
+def test_export_old_gdal(maindb, tmp_path, monkeypatch):
+    monkeypatch.setattr(exporters.pyogrio, "__gdal_version__", (3, 6, 2))
+    with pytest.raises(ValueError, match="GDAL >= 3.8"):
+        exporters.ZoneLevelExporter(db=maindb, zone_level="gemeinde").export_result(
+            filepath=str(tmp_path / "gemeinde.fgb")
+        )
+
+
+def test_mvt_getter(maindb, tmp_path):
+    cache = GetterCache(cache_folder=str(tmp_path))
+    getter = tile_getters.MVTGetter(
+        db=maindb, z=8, x=139, y=88, zone_level="bezirk"
+    )  # Vienna
+    tile = getter.get_result(cache=cache)
+    assert isinstance(tile, bytes) and len(tile) > 0
+    assert getter.get_result(cache=cache) == tile
+    assert cache.stats()["hits"] == 1
+    empty = tile_getters.MVTGetter(db=maindb, z=8, x=0, y=0).get_result()
+    assert empty == b""
+
+
 def test_loc_solver(maindb):
     maindb.cursor.execute(
         """
@@ -172,6 +593,53 @@ def test_loc_solver(maindb):
     maindb.connection.commit()
 
 
+def test_loc_solver_chunked(maindb):
+    maindb.cursor.execute(
+        """
+        DROP TABLE IF EXISTS test_loc_solver;
+        CREATE TABLE IF NOT EXISTS test_loc_solver(
+            id1 BIGINT,
+            id2 BIGINT,
+            address TEXT,
+            geom GEOMETRY(POINT,4326),
+            PRIMARY KEY(id1,id2)
+            );
+
+        INSERT INTO test_loc_solver(id1,id2,address,geom) VALUES
+        (1,1,'josefstadter str. 39',NULL),
+        (1,2,'josefstadter str. 39',NULL),
+        (2,1,'josefstadter str. 39',NULL),
+        (2,2,'wien',NULL),
+        (2,3,'ortaköy,istanbul',NULL),
+        (3,1,'ortaköy,istanbul',NULL),
+        (4,1,'üsküdar,istanbul',NULL)
+        ;
+        """
+    )
+    maindb.connection.commit()
+    progress = []
+    maindb.add_filler(
+        loc_resolver.LocationResolver(
+            id_col=("id1", "id2"),
+            source_db=maindb,
+            loc_col="address",
+            query_table="test_loc_solver",
+            chunk_size=2,
+            progress_callback=progress.append,
+            resolver_args=dict(
+                nominatim_host=None,
+                nominatim_user_agent="gis_fillers_test",
+                unsafe_nominatim=True,
+            ),
+        )
+    )
+    maindb.fill_db()
+    # rows sharing the address of an earlier chunk are updated with it: (2,1) in the first chunk, (3,1) in the second
+    assert [p["processed"] for p in progress] == [3, 6, 7]
+    assert progress[0]["last_id"] == (1, 2)
+    assert progress[-1]["total"] == 7
+
+
 ctry_list = [
     dict(
         data=[
@@ -249,6 +717,25 @@ ctry_list = [
         lang=None,
         format="alpha_3",
     ),
+    dict(
+        data=[
+            ("040", "1080"),
+            (40, "1080"),
+            ("Österreich", "1080"),
+            ("AUT", "1080"),
+            ("at", "1080"),
+            ("Republic of Austria", "1080"),
+            ("Frankreich", "33400"),
+            ("250", "33400"),
+            ("FRA", "33400"),
+            ("FR", "33400"),
+            ("France", "33400"),
+            ("France", "99999999"),
+            ("BLAH", "1"),
+        ],
+        lang="de",
+        format="any",
+    ),
 ]
 
 
@@ -287,3 +774,230 @@ def test_loc_solver_countries(maindb, country_args):
     )
     maindb.fill_db()
     maindb.connection.commit()
+
+
+def test_loc_solver_server_side(maindb, country_args):
+    maindb.cursor.execute(
+        f"""
+        DROP TABLE IF EXISTS test_loc_solver;
+        CREATE TABLE IF NOT EXISTS test_loc_solver(
+            id BIGSERIAL PRIMARY KEY,
+            plz TEXT,
+            country TEXT,
+            geom GEOMETRY(POINT,4326)
+            );
+
+        INSERT INTO test_loc_solver(country,plz,geom) VALUES
+        {','.join([f'''('{ct}','{zc}',NULL)''' for ct,zc in country_args['data']])};
+        """
+    )
+    maindb.connection.commit()
+    resolved = []
+    for server_side in (False, True):
+        maindb.cursor.execute("UPDATE test_loc_solver SET geom=NULL;")
+        maindb.add_filler(
+            loc_resolver.LocationResolver(
+                id_col="id",
+                source_db=maindb,
+                loc_col=("country", "plz"),
+                query_table="test_loc_solver",
+                resolver_class="zipcode",
+                server_side=server_side,
+                resolver_args=dict(
+                    country_language=country_args["lang"],
+                    country_format=country_args["format"],
+                ),
+            )
+        )
+        maindb.fill_db()
+        maindb.cursor.execute(
+            "SELECT id,ST_AsText(geom) FROM test_loc_solver ORDER BY id;"
+        )
+        resolved.append(maindb.cursor.fetchall())
+    assert resolved[0] == resolved[1]
+
+
+def test_loc_solver_distinct(maindb):
+    data = ctry_list[0]["data"]
+    maindb.cursor.execute(
+        f"""
+        DROP TABLE IF EXISTS test_loc_solver;
+        CREATE TABLE IF NOT EXISTS test_loc_solver(
+            id BIGSERIAL PRIMARY KEY,
+            plz TEXT,
+            country TEXT,
+            geom GEOMETRY(POINT,4326)
+            );
+
+        INSERT INTO test_loc_solver(country,plz,geom) VALUES
+        {','.join([f'''('{ct}','{zc}',NULL)''' for ct,zc in data])};
+        """
+    )
+    location_lists = []
+
+    class RecordingZipPointsGetter(generic_getters.ZipPointsGetter):
+        def __init__(self, location_list, **kwargs):
+            location_lists.append(location_list)
+            generic_getters.ZipPointsGetter.__init__(
+                self, location_list=location_list, **kwargs
+            )
+
+    maindb.add_filler(
+        loc_resolver.LocationResolver(
+            id_col="id",
+            source_db=maindb,
+            loc_col=("country", "plz"),
+            query_table="test_loc_solver",
+            resolver_class=RecordingZipPointsGetter,
+        )
+    )
+    maindb.fill_db()
+    assert len(location_lists) == 1
+    assert sorted(location_lists[0]) == sorted(set(data))
+    maindb.cursor.execute(
+        "SELECT COUNT(*) FROM test_loc_solver WHERE geom IS NOT NULL GROUP BY country,plz ORDER BY country,plz;"
+    )
+    assert [c for (c,) in maindb.cursor.fetchall()] == [6, 5]
+
+
+def test_loc_solver_null_locations(maindb):
+    maindb.cursor.execute(
+        """
+        DROP TABLE IF EXISTS test_loc_solver;
+        CREATE TABLE IF NOT EXISTS test_loc_solver(
+            id BIGSERIAL PRIMARY KEY,
+            street TEXT,
+            city TEXT,
+            geom GEOMETRY(POINT,4326)
+            );
+
+        INSERT INTO test_loc_solver(street,city,geom) VALUES
+        ('Karlsplatz 13','Wien',NULL),
+        (NULL,'Wien',NULL),
+        (NULL,'Wien',NULL),
+        ('Karlsplatz 13',NULL,NULL),
+        (NULL,NULL,NULL);
+        """
+    )
+    location_lists = []
+
+    class ConstantPointsGetter(object):
+        columns = ("lat", "long")
+
+        def __init__(self, location_list, **kwargs):
+            location_lists.append(location_list)
+            self.location_list = location_list
+
+        def get_result(self, raw_data=True):
+            return [(48.1991, 16.3698)] * len(self.location_list)
+
+    maindb.add_filler(
+        loc_resolver.LocationResolver(
+            id_col="id",
+            source_db=maindb,
+            loc_col=("street", "city"),
+            query_table="test_loc_solver",
+            resolver_class=ConstantPointsGetter,
+        )
+    )
+    maindb.fill_db()
+    assert len(location_lists[0]) == 4
+    assert (None, "Wien") in location_lists[0]
+    maindb.cursor.execute("SELECT COUNT(*) FROM test_loc_solver WHERE geom IS NULL;")
+    assert maindb.cursor.fetchone()[0] == 0
+
+
+@pytest.mark.parametrize("server_side", [False, True])
+def test_loc_solver_area(maindb, server_side):
+    maindb.cursor.execute(
+        """
+        DROP TABLE IF EXISTS test_loc_solver;
+        CREATE TABLE IF NOT EXISTS test_loc_solver(
+            id BIGSERIAL PRIMARY KEY,
+            bezirk TEXT,
+            geom GEOMETRY(POINT,4326)
+            );
+
+        INSERT INTO test_loc_solver(bezirk,geom) VALUES
+        ('101',NULL),('101',NULL),('918',NULL),('unknown',NULL);
+        """
+    )
+    maindb.add_filler(
+        loc_resolver.LocationResolver(
+            id_col="id",
+            source_db=maindb,
+            loc_col="bezirk",
+            query_table="test_loc_solver",
+            resolver_class="area",
+            server_side=server_side,
+            resolver_args=dict(zone_level="bezirk"),
+        )
+    )
+    maindb.fill_db()
+    maindb.cursor.execute(
+        """
+        SELECT t.bezirk,ST_Within(t.geom,gd.geom) FROM test_loc_solver t
+        LEFT OUTER JOIN zones z
+            ON z.code=t.bezirk
+            AND z.level=(SELECT id FROM zone_levels WHERE name='bezirk')
+        LEFT OUTER JOIN gis_data gd
+            ON gd.zone_id=z.id AND gd.zone_level=z.level
+            AND gd.gis_type=(SELECT id FROM gis_types WHERE name='zaehlsprengel')
+        ORDER BY t.id;
+        """
+    )
+    assert maindb.cursor.fetchall() == [
+        ("101", True),
+        ("101", True),
+        ("918", True),
+        ("unknown", None),
+    ]
+
+
+@pytest.mark.parametrize("negative_cache_ttl,attempts", [(3600, 1), (0, 2)])
+def test_negative_cache(maindb, negative_cache_ttl, attempts):
+    maindb.cursor.execute(
+        """
+        INSERT INTO cached_addresses(address,geom,status,updated_at,attempts)
+        VALUES ('qwxzkj nowhere 12345',NULL,'not_found',CURRENT_TIMESTAMP,1)
+        ON CONFLICT (address) DO UPDATE
+        SET status='not_found',updated_at=CURRENT_TIMESTAMP,attempts=1;
+        """
+    )
+    maindb.connection.commit()
+    gdf = generic_getters.AddressPointsGetter(
+        db=maindb,
+        location_list=["qwxzkj nowhere 12345"] * 3,
+        nominatim_host=None,
+        nominatim_user_agent="gis_fillers_test",
+        unsafe_nominatim=True,
+        negative_cache_ttl=negative_cache_ttl,
+    ).get_result()
+    assert gdf["geometry"].isna().all()
+    maindb.cursor.execute(
+        "SELECT status,attempts FROM cached_addresses WHERE address='qwxzkj nowhere 12345';"
+    )
+    assert maindb.cursor.fetchone() == ("not_found", attempts)
+
+
+def test_address_normalization(maindb):
+    kwargs = dict(
+        db=maindb,
+        location_list=[
+            "Josefstädter Str. 39, Wien",
+            "josefstadter str. 39, wien",
+            "Josefstädter Straße 39, Wien",
+        ],
+        nominatim_host=None,
+        nominatim_user_agent="gis_fillers_test",
+        unsafe_nominatim=True,
+    )
+    getter = generic_getters.AddressPointsGetter(**kwargs)
+    gdf = getter.get_result()
+    assert list(gdf["location"]) == kwargs["location_list"]
+    assert getter.cache_stats["unique"] == 1
+    assert gdf["geometry"].nunique() == 1
+
+    getter = generic_getters.AddressPointsGetter(**kwargs)
+    getter.get_result()
+    assert getter.cache_stats["misses"] == 0
@@ -0,0 +1,168 @@
+import pytest
+import time
+import json
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from geopy.geocoders import Nominatim
+
+from gis_fillers.getters import geocoding
+
+addresses = {
+    "josefstadter str. 39": (48.2107, 16.3473),
+    "karlsplatz 13": (48.1991, 16.3698),
+}
+
+
+class NominatimStandIn(BaseHTTPRequestHandler):
+    """
+    Answers /search requests like Nominatim, for the addresses above. Returns 503 if server.failing is set.
+    """
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.server.failing:
+            self.send_response(503)
+            self.end_headers()
+            return
+        time.sleep(self.server.delay)
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        address = query["q"][0]
+        if address in addresses:
+            lat, lon = addresses[address]
+            ans = [dict(lat=str(lat), lon=str(lon), display_name=address)]
+        else:
+            ans = []
+        body = json.dumps(ans).encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def nominatim():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), NominatimStandIn)
+    server.requests = []
+    server.failing = False
+    server.delay = 0.0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_geolocator(server):
+    return Nominatim(
+        user_agent="gis_fillers_test",
+        domain=f"127.0.0.1:{server.server_address[1]}",
+        scheme="http",
+        timeout=5,
+    )
+
+
+def test_geocoding_pool(nominatim):
+    nominatim.delay = 0.2
+    pool = geocoding.GeocodingPool(geolocator=get_geolocator(nominatim), max_workers=8)
+    address_list = list(addresses) * 5 + [f"unknown {i}" for i in range(6)]
+    start = time.monotonic()
+    ans = pool.geocode(address_list)
+    assert time.monotonic() - start < 1.0  # 8 requests of 0.2s in parallel
+    assert len(nominatim.requests) == 8
+    assert len(ans) == 8
+    for address, (lat, lon) in addresses.items():
+        assert (ans[address].latitude, ans[address].longitude) == (lat, lon)
+    assert ans["unknown 0"] is None
+
+
+def test_geocoding_rate_limit(nominatim):
+    pool = geocoding.GeocodingPool(
+        geolocator=get_geolocator(nominatim), max_workers=8, rate_limit=20
+    )
+    start = time.monotonic()
+    pool.geocode([f"unknown {i}" for i in range(6)])
+    assert time.monotonic() - start >= 0.25
+
+
+def test_circuit_breaker(nominatim):
+    nominatim.failing = True
+    breaker = geocoding.CircuitBreaker(failure_threshold=3, reset_timeout=0.5)
+    pool = geocoding.GeocodingPool(
+        geolocator=get_geolocator(nominatim), max_workers=1, circuit_breaker=breaker
+    )
+    assert pool.geocode([f"unknown {i}" for i in range(10)]) == dict()
+    assert len(nominatim.requests) == 3
+    assert pool.failed == 3 and pool.skipped == 7
+    assert breaker.is_open
+
+    nominatim.failing = False
+    time.sleep(0.5)
+    ans = pool.geocode(list(addresses))
+    assert len(ans) == 2 and not breaker.is_open
+    assert pool.failed == 3 and pool.skipped == 7  # counted over the pool lifetime
+
+
+def test_raise_errors(nominatim):
+    nominatim.failing = True
+    pool = geocoding.GeocodingPool(
+        geolocator=get_geolocator(nominatim), max_workers=4, raise_errors=True
+    )
+    with pytest.raises(geocoding.TRANSIENT_ERRORS):
+        pool.geocode([f"unknown {i}" for i in range(4)])
+
+
+def test_shared_health(nominatim):
+    breaker = geocoding.CircuitBreaker()
+    geolocator = get_geolocator(nominatim)
+    assert geocoding.check_geocoder(geolocator=geolocator, circuit_breaker=breaker)
+    assert geocoding.check_geocoder(geolocator=geolocator, circuit_breaker=breaker)
+    assert len(nominatim.requests) == 1
+
+    nominatim.failing = True
+    assert (
+        geocoding.check_geocoder(
+            geolocator=geolocator, circuit_breaker=breaker, health_ttl=0
+        )
+        is False
+    )
+
+
+def test_address_cache():
+    cache = geocoding.AddressCache(front_cache_size=2)
+    cache.add("a", 48.0, 16.0)
+    cache.remember("b", 47.0, 15.0)
+    assert cache.lookup(["a", "c"]) == {"a": (48.0, 16.0)}
+    cache.remember("c", 46.0, 14.0)  # evicts b, least recently used
+    assert set(cache.lookup(["a", "b", "c"])) == {"a", "c"}
+    assert (cache.hits, cache.misses) == (3, 2)
+
+    assert list(cache.pending) == ["a"]
+    assert not cache.needs_flush(flush_size=2, flush_interval=60)
+    cache.add("d", 45.0, 13.0)
+    assert cache.needs_flush(flush_size=2, flush_interval=60)
+    assert cache.needs_flush(flush_size=10, flush_interval=0)
+
+
+def test_address_normalizer():
+    normalizer = geocoding.AddressNormalizer()
+    assert (
+        normalizer("Josefstädter Str. 39")
+        == normalizer("josefstadter str. 39")
+        == normalizer(" Josefstädter  Straße 39")
+        == "josefstadter strasse 39"
+    )
+    assert normalizer("Hauptstr. 1") == "hauptstrasse 1"
+    assert normalizer("Lange G. 5/3, Wien") == "lange gasse 5/3 wien"
+    assert normalizer("ortaköy, istanbul") == normalizer("Ortaköy,Istanbul")
+
+    custom = geocoding.AddressNormalizer(
+        abbreviations={"pl.": "platz"}, strip_accents=False
+    )
+    assert custom("Karls Pl. 13") == "karls platz 13"
+    assert custom("Hauptstr. 1") == "hauptstrasse 1"
+    assert custom("Ortaköy") == "ortaköy"